@@ -0,0 +1,52 @@
+"""
+Memory and parse-time benchmark of `ItemSummary` records against `pystac.Item`.
+
+Usage:
+    python benchmarks/bench_item_summary.py --items 365 --leadtime 93
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from pystac import Item  # noqa: E402
+from stac.summary import ItemSummary  # noqa: E402
+
+from synthetic import make_collection_items  # noqa: E402
+
+
+def measure(label: str, build) -> None:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    records = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:<14} {len(records):>6} items  "
+        f"retained {retained / 2**20:8.2f} MiB  peak {peak / 2**20:8.2f} MiB  "
+        f"parse {elapsed * 1000:8.1f} ms"
+    )
+    del records
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument("--items", type=int, default=365, help="Items in the collection")
+    argparser.add_argument("--leadtime", type=int, default=93, help="COG assets per item")
+    args = argparser.parse_args()
+
+    raw = make_collection_items("bench", args.items, leadtime=args.leadtime)
+
+    measure("pystac.Item", lambda: [Item.from_dict(item) for item in raw])
+    measure("ItemSummary", lambda: [ItemSummary.from_dict("bench", item) for item in raw])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Concurrent-user load test of the dashboard's Dash callback endpoint.
+
+Starts stand-in STAC and tiler services, serves `app:server` with gunicorn for
+each requested worker/thread combination, and drives `/_dash-update-component`
+with many concurrent sessions. Each session loads the page, picks collections,
+picks a forecast date and then scrubs the leadtime slider, firing the same
+server callbacks the browser would.
+
+Usage:
+    python benchmarks/loadtest.py --workers 1,2,4 --threads 1,4 --sessions 40 --concurrency 20
+"""
+import argparse
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from stand_ins import StandInSTAC, StandInTiler
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+# Arctic viewport, as `dl.Map.bounds`
+DEFAULT_BOUNDS = [[45.0, -180.0], [90.0, 180.0]]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _parse_outputs(output: str) -> list[dict]:
+    """
+    Split a Dash dependency output string into `{"id", "property"}` dicts.
+    """
+    specs = output[2:-2].split("...") if output.startswith("..") else [output]
+    outputs = []
+    for spec in specs:
+        component_id, prop = spec.rsplit(".", 1)
+        outputs.append({"id": component_id, "property": prop.split("@")[0]})
+    return outputs
+
+
+def _collect_props(node, props: dict) -> None:
+    """
+    Walk the serialised layout, recording initial property values by 'id.prop'.
+    """
+    if isinstance(node, list):
+        for child in node:
+            _collect_props(child, props)
+        return
+    if not isinstance(node, dict) or "props" not in node:
+        return
+    node_props = node["props"]
+    component_id = node_props.get("id")
+    for name, value in node_props.items():
+        if isinstance(component_id, str):
+            props[f"{component_id}.{name}"] = value
+        if isinstance(value, (dict, list)):
+            _collect_props(value, props)
+
+
+class Recorder:
+    """
+    Thread-safe record of callback request latencies and response sizes, both
+    decoded and as sent on the wire (compressed).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.bytes_received = 0
+        self.wire_bytes = 0
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, name: str, latency: float, size: int, wire_size: int, ok: bool) -> None:
+        with self._lock:
+            self.latencies[name].append(latency)
+            self.bytes_received += size
+            self.wire_bytes += wire_size
+            self.requests += 1
+            self.errors += 0 if ok else 1
+
+    def all_latencies(self) -> list[float]:
+        return [value for values in self.latencies.values() for value in values]
+
+
+class DashSession:
+    """
+    One simulated browser session against a running dashboard.
+
+    Keeps a local copy of every component property, and on `set()` fires each
+    server-side callback listening to that property, applies its outputs and
+    cascades to the callbacks those outputs trigger, like the Dash renderer.
+
+    Args:
+        base_url: URL of the dashboard.
+        dependencies: The app's `/_dash-dependencies`.
+        layout_props: Initial property values from `/_dash-layout`.
+        recorder: Where request latencies are recorded.
+    """
+
+    def __init__(self, base_url: str, dependencies: list, layout_props: dict, recorder: Recorder) -> None:
+        self.base_url = base_url
+        self.props = dict(layout_props)
+        # Set by clientside callbacks in the browser
+        self.props["window-width.data"] = 1280
+        self.props["session-id.data"] = uuid.uuid4().hex
+        self.recorder = recorder
+        self.http = requests.Session()
+        # As a browser would, so compressed payloads are measured
+        self.http.headers["Accept-Encoding"] = "br, gzip"
+        self.callbacks = [dep for dep in dependencies if not dep.get("clientside_function")]
+
+    def _payload(self, callback: dict, changed: list[str]) -> dict:
+        outputs = _parse_outputs(callback["output"])
+        return {
+            "output": callback["output"],
+            "outputs": outputs if len(outputs) > 1 or callback["output"].startswith("..") else outputs[0],
+            "inputs": [
+                {**dep, "value": self.props.get(f"{dep['id']}.{dep['property']}")}
+                for dep in callback["inputs"]
+            ],
+            "state": [
+                {**dep, "value": self.props.get(f"{dep['id']}.{dep['property']}")}
+                for dep in callback["state"]
+            ],
+            "changedPropIds": changed,
+        }
+
+    def _post(self, callback: dict, payload: dict) -> dict:
+        url = f"{self.base_url}/_dash-update-component"
+        start = time.perf_counter()
+        response = self.http.post(url, json=payload, timeout=120)
+        size = len(response.content)
+        # Bytes read from the socket, before decompression
+        wire_size = response.raw.tell()
+        # Background callbacks answer with job handles, poll until the job finishes.
+        if response.status_code == 200 and "cacheKey" in response.json():
+            handles = {key: response.json()[key] for key in ("cacheKey", "job")}
+            while True:
+                time.sleep(0.1)
+                response = self.http.post(url, params=handles, json=payload, timeout=120)
+                size += len(response.content)
+                wire_size += response.raw.tell()
+                if response.status_code != 200 or "response" in response.json():
+                    break
+        ok = response.status_code in (200, 204)
+        self.recorder.record(callback["output"], time.perf_counter() - start, size, wire_size, ok)
+        if response.status_code != 200:
+            return {}
+        return response.json().get("response", {})
+
+    def set(self, component_id: str, prop: str, value, max_depth: int = 4) -> None:
+        """
+        Set a property as the user would, firing and cascading dependent callbacks.
+        """
+        self.props[f"{component_id}.{prop}"] = value
+        queue = deque([(f"{component_id}.{prop}", None, 0)])
+        while queue:
+            changed, source, depth = queue.popleft()
+            for callback in self.callbacks:
+                if callback is source:
+                    continue
+                if changed not in {f"{dep['id']}.{dep['property']}" for dep in callback["inputs"]}:
+                    continue
+                updates = self._post(callback, self._payload(callback, [changed]))
+                for out_id, out_props in updates.items():
+                    for out_prop, out_value in out_props.items():
+                        key = f"{out_id}.{out_prop}"
+                        self.props[key] = out_value
+                        if depth + 1 < max_depth:
+                            queue.append((key, callback, depth + 1))
+
+    def run(self, n_collections: int, scrub_steps: int, think_time: float) -> None:
+        """
+        Pick collections, pick the latest forecast date, then scrub the leadtime slider.
+        """
+        self.set("page-load-trigger", "data", True)
+        self.set("map", "bounds", DEFAULT_BOUNDS)
+        # The browser commits the viewport clientside once the map stops moving
+        self.set("viewport-committed", "data", DEFAULT_BOUNDS)
+        options = self.props.get("collections-dropdown.options") or []
+        chosen = [option["value"] for option in options[:n_collections]]
+        if not chosen:
+            return
+        self.set("collections-dropdown", "value", chosen)
+        dates = sorted((self.props.get("forecast-dates-store.data") or {}).keys())
+        if not dates:
+            return
+        time.sleep(think_time)
+        self.set("forecast-init-date-picker", "value", dates[-1])
+        slider_max = self.props.get("leadtime-slider.max") or scrub_steps
+        for seq, leadtime in enumerate(range(min(scrub_steps, int(slider_max) + 1)), start=1):
+            time.sleep(random.uniform(0, think_time))
+            # The browser commits the slider value clientside once it settles
+            self.set(
+                "leadtime-committed",
+                "data",
+                {"leadtime": leadtime, "seq": seq, "session": self.props["session-id.data"]},
+            )
+
+
+def run_scenario(args, workers: int, threads: int, stac: StandInSTAC, tiler: StandInTiler) -> dict:
+    """
+    Serve the app with gunicorn using `workers` x `threads` and run all sessions.
+    """
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "PYTHONPATH": SRC_DIR,
+        "STAC_FASTAPI_URL": stac.url,
+        "TILER_URL": tiler.url,
+        "BACKGROUND_CACHE_DIR": tempfile.mkdtemp(prefix="loadtest-jobs-"),
+    }
+    cmd = [
+        sys.executable, "-m", "gunicorn", "app:server",
+        "-b", f"127.0.0.1:{port}", "-w", str(workers), "--threads", str(threads),
+        "--timeout", "120", "--log-level", "warning",
+    ]
+    server = subprocess.Popen(cmd, cwd=SRC_DIR, env=env)
+    try:
+        for _ in range(300):
+            try:
+                if requests.get(f"{base_url}/_dash-layout", timeout=5).ok:
+                    break
+            except requests.RequestException:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError("Dashboard did not start")
+
+        dependencies = requests.get(f"{base_url}/_dash-dependencies").json()
+        layout_props = {}
+        _collect_props(requests.get(f"{base_url}/_dash-layout").json(), layout_props)
+
+        stac.reset()
+        tiler.reset()
+        recorder = Recorder()
+
+        def session() -> None:
+            DashSession(base_url, dependencies, layout_props, recorder).run(
+                args.collections, args.scrub_steps, args.think_time
+            )
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for future in [pool.submit(session) for _ in range(args.sessions)]:
+                future.result()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = recorder.all_latencies()
+    upstream = stac.total_requests + tiler.total_requests
+    return {
+        "workers": workers,
+        "threads": threads,
+        "requests": recorder.requests,
+        "errors": recorder.errors,
+        "p50": _percentile(latencies, 50),
+        "p95": _percentile(latencies, 95),
+        "p99": _percentile(latencies, 99),
+        "throughput": recorder.requests / elapsed,
+        "amplification": upstream / max(1, recorder.requests),
+        "bytes_per_session": recorder.bytes_received / max(1, args.sessions),
+        "wire_bytes_per_session": recorder.wire_bytes / max(1, args.sessions),
+        "per_callback": {
+            name: (statistics.median(values), _percentile(values, 95), len(values))
+            for name, values in recorder.latencies.items()
+        },
+    }
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument("--workers", default="1,2", help="Comma separated gunicorn worker counts")
+    argparser.add_argument("--threads", default="1,4", help="Comma separated gunicorn thread counts")
+    argparser.add_argument("--sessions", type=int, default=20, help="Total sessions per scenario")
+    argparser.add_argument("--concurrency", type=int, default=10, help="Sessions running at once")
+    argparser.add_argument("--collections", type=int, default=2, help="Collections each session selects")
+    argparser.add_argument("--scrub-steps", type=int, default=15, help="Leadtime slider steps per session")
+    argparser.add_argument("--think-time", type=float, default=0.05, help="Max pause between slider steps (s)")
+    argparser.add_argument("--upstream-latency", type=float, default=0.02, help="Stand-in latency per request (s)")
+    argparser.add_argument("--items", type=int, default=90, help="Forecast items per stand-in collection")
+    argparser.add_argument("--verbose", action="store_true", help="Print per-callback latencies")
+    args = argparser.parse_args()
+
+    stac = StandInSTAC(items=args.items, latency=args.upstream_latency).start()
+    tiler = StandInTiler(latency=args.upstream_latency).start()
+    try:
+        print(
+            f"{'workers':>7} {'threads':>7} {'requests':>8} {'errors':>6} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>7} {'upstream/req':>12} {'KiB/session':>11} {'wire KiB/session':>16}"
+        )
+        for workers in [int(w) for w in args.workers.split(",")]:
+            for threads in [int(t) for t in args.threads.split(",")]:
+                result = run_scenario(args, workers, threads, stac, tiler)
+                print(
+                    f"{workers:>7} {threads:>7} {result['requests']:>8} {result['errors']:>6} "
+                    f"{result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f} {result['p99'] * 1000:>8.1f} "
+                    f"{result['throughput']:>7.1f} {result['amplification']:>12.2f} "
+                    f"{result['bytes_per_session'] / 1024:>11.1f} {result['wire_bytes_per_session'] / 1024:>16.1f}"
+                )
+                if args.verbose:
+                    for name, (p50, p95, count) in sorted(result["per_callback"].items()):
+                        print(f"    {name[:70]:<70} n={count:<5} p50={p50 * 1000:.1f}ms p95={p95 * 1000:.1f}ms")
+    finally:
+        stac.stop()
+        tiler.stop()
+
+
+if __name__ == "__main__":
+    main()
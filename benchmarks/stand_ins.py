@@ -0,0 +1,246 @@
+"""
+Stand-in STAC API and titiler services for benchmarks.
+
+Both run in-process on `ThreadingHTTPServer`s, answer only the requests the
+dashboard makes, and count every request so upstream call amplification can be
+measured.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from synthetic import make_collection_items
+
+CONFORMANCE = [
+    "https://api.stacspec.org/v1.0.0/core",
+    "https://api.stacspec.org/v1.0.0/collections",
+    "https://api.stacspec.org/v1.0.0/item-search",
+    "https://api.stacspec.org/v1.0.0/item-search#query",
+    "https://api.stacspec.org/v1.0.0/ogcapi-features",
+    "http://www.opengis.net/spec/ogcapi-features-1/1.0/conf/core",
+    "http://www.opengis.net/spec/ogcapi-features-1/1.0/conf/geojson",
+]
+
+# Smallest valid PNG (1x1 transparent pixel), returned for tiles and previews.
+PNG_1X1 = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082"
+)
+
+
+class _StandIn:
+    """
+    Base for a stand-in service running on a background thread.
+
+    Args:
+        latency: Seconds to sleep before answering each request.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                service._handle(self, "GET")
+
+            def do_POST(self) -> None:
+                service._handle(self, "POST")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def total_requests(self) -> int:
+        with self._lock:
+            return sum(self.requests.values())
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests.clear()
+
+    def start(self) -> "_StandIn":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        parsed = urlparse(handler.path)
+        params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        body = {}
+        if method == "POST":
+            length = int(handler.headers.get("Content-Length", 0))
+            body = json.loads(handler.rfile.read(length) or b"{}")
+        with self._lock:
+            self.requests[parsed.path.split("/")[1] or "/"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        status, content_type, payload = self.route(parsed.path, params, body)
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload).encode()
+        etag = f'"{hashlib.sha1(payload).hexdigest()[:16]}"'
+        if method == "GET" and status == 200 and handler.headers.get("If-None-Match") == etag:
+            handler.send_response(304)
+            handler.send_header("ETag", etag)
+            handler.end_headers()
+            return
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("ETag", etag)
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def route(self, path: str, params: dict, body: dict) -> tuple[int, str, bytes | dict]:
+        raise NotImplementedError
+
+
+class StandInSTAC(_StandIn):
+    """
+    Minimal STAC API serving synthetic daily forecast items.
+
+    Args:
+        collections: Number of collections.
+        items: Forecast items (days) per collection.
+        leadtime: Leadtime days (COG assets) per item.
+        page_size: Default search page size.
+        latency: Seconds to sleep before answering each request.
+    """
+
+    def __init__(
+        self,
+        collections: int = 3,
+        items: int = 60,
+        leadtime: int = 93,
+        page_size: int = 100,
+        latency: float = 0.0,
+    ) -> None:
+        super().__init__(latency)
+        self.page_size = page_size
+        self.items = {
+            f"forecast-{idx}": make_collection_items(f"forecast-{idx}", items, leadtime=leadtime)
+            for idx in range(collections)
+        }
+
+    def _collection(self, collection_id: str) -> dict:
+        items = self.items[collection_id]
+        return {
+            "type": "Collection",
+            "stac_version": "1.0.0",
+            "id": collection_id,
+            "description": f"Stand-in forecast collection {collection_id}",
+            "license": "proprietary",
+            "extent": {
+                "spatial": {"bbox": [items[0]["bbox"]]},
+                "temporal": {
+                    "interval": [[items[0]["properties"]["datetime"], items[-1]["properties"]["datetime"]]]
+                },
+            },
+            "links": [
+                {"rel": "self", "href": f"{self.url}/collections/{collection_id}"},
+                {"rel": "root", "href": f"{self.url}/"},
+                {"rel": "items", "href": f"{self.url}/collections/{collection_id}/items"},
+            ],
+        }
+
+    def _search(self, query: dict) -> dict:
+        collections = query.get("collections") or list(self.items)
+        if isinstance(collections, str):
+            collections = collections.split(",")
+        eq = (query.get("query") or {}).get("forecast:reference_time", {}).get("eq")
+        ids = query.get("ids")
+        features = [
+            item
+            for collection_id in collections
+            for item in self.items.get(collection_id, [])
+            if (eq is None or item["properties"]["forecast:reference_time"] == eq)
+            and (ids is None or item["id"] in ids)
+        ]
+        sortby = query.get("sortby") or []
+        if sortby and isinstance(sortby, list) and sortby[0].get("direction") == "desc":
+            features.reverse()
+        limit = int(query.get("limit") or self.page_size)
+        offset = int(query.get("token") or 0)
+        page = {
+            "type": "FeatureCollection",
+            "features": features[offset:offset + limit],
+            "numberMatched": len(features),
+            "links": [],
+        }
+        if offset + limit < len(features):
+            page["links"].append({
+                "rel": "next",
+                "href": f"{self.url}/search",
+                "method": "POST",
+                "body": {**query, "token": offset + limit},
+            })
+        return page
+
+    def route(self, path, params, body):
+        parts = [part for part in path.split("/") if part]
+        if not parts:
+            return 200, "application/json", {
+                "type": "Catalog",
+                "stac_version": "1.0.0",
+                "id": "stand-in",
+                "description": "Stand-in STAC API",
+                "conformsTo": CONFORMANCE,
+                "links": [
+                    {"rel": "self", "href": f"{self.url}/"},
+                    {"rel": "root", "href": f"{self.url}/"},
+                    {"rel": "data", "href": f"{self.url}/collections"},
+                    {"rel": "conformance", "href": f"{self.url}/conformance"},
+                    {"rel": "search", "type": "application/geo+json", "href": f"{self.url}/search", "method": "GET"},
+                    {"rel": "search", "type": "application/geo+json", "href": f"{self.url}/search", "method": "POST"},
+                ],
+            }
+        if parts == ["conformance"]:
+            return 200, "application/json", {"conformsTo": CONFORMANCE}
+        if parts == ["collections"]:
+            return 200, "application/json", {
+                "collections": [self._collection(c) for c in self.items],
+                "links": [],
+            }
+        if parts[0] == "collections" and parts[1] in self.items:
+            if len(parts) == 2:
+                return 200, "application/json", self._collection(parts[1])
+            return 200, "application/json", self._search({**params, "collections": [parts[1]]})
+        if parts == ["search"]:
+            query = body or params
+            if isinstance(query.get("query"), str):
+                query["query"] = json.loads(query["query"])
+            return 200, "application/geo+json", self._search(query)
+        return 404, "application/json", {"code": "NotFound", "description": path}
+
+
+class StandInTiler(_StandIn):
+    """
+    Minimal titiler answering statistics, tile and preview requests.
+    """
+
+    def route(self, path, params, body):
+        if path.endswith("/statistics"):
+            return 200, "application/json", {
+                f"b{params.get('bidx', 1)}": {"min": 0.0, "max": 1.0, "mean": 0.5, "std": 0.2}
+            }
+        if "/tiles/" in path or "/preview" in path or "/bbox/" in path:
+            return 200, "image/png", PNG_1X1
+        return 404, "application/json", {"detail": "Not Found"}
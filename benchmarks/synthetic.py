@@ -0,0 +1,78 @@
+"""
+Synthetic forecast STAC Items shaped like those from environmental-stac-generator.
+"""
+from datetime import datetime, timedelta, timezone
+
+COG_MEDIA_TYPE = "image/tiff; application=geotiff; profile=cloud-optimized"
+DEFAULT_BANDS = ["sic_mean", "sic_stddev"]
+
+
+def make_item(
+    collection_id: str,
+    reference_time: datetime,
+    leadtime: int = 93,
+    bands: list[str] = DEFAULT_BANDS,
+    bbox: list[float] = [-180.0, 16.6, 180.0, 90.0],
+    data_url: str = "http://data.local",
+) -> dict:
+    """
+    Build a STAC Item dict with one COG data asset per leadtime day.
+
+    Args:
+        collection_id: Collection the item belongs to.
+        reference_time: Forecast initialisation time (UTC).
+        leadtime: Number of leadtime days, i.e. COG assets.
+        bands: Band names listed in each asset's `forecast:bands`.
+        bbox: The item's bbox.
+        data_url: Base URL the COG hrefs point at.
+
+    Returns:
+        The item as a dict.
+    """
+    reference_str = reference_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+    end_str = (reference_time + timedelta(days=leadtime)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    band_props = [{"name": name, "index": idx + 1} for idx, name in enumerate(bands)]
+    assets = {}
+    for day in range(leadtime):
+        key = reference_str if day == 0 else (reference_time + timedelta(days=day)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        assets[key] = {
+            "href": f"{data_url}/{collection_id}/{reference_str[:10]}/leadtime_{day:03d}.tif",
+            "type": COG_MEDIA_TYPE,
+            "roles": ["data"],
+            "title": f"Leadtime {day}",
+            "forecast:bands": band_props,
+        }
+    west, south, east, north = bbox
+    return {
+        "type": "Feature",
+        "stac_version": "1.0.0",
+        "stac_extensions": [],
+        "id": f"{collection_id}_{reference_str[:10]}",
+        "collection": collection_id,
+        "bbox": bbox,
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[west, south], [east, south], [east, north], [west, north], [west, south]]],
+        },
+        "properties": {
+            "datetime": reference_str,
+            "forecast:reference_time": reference_str,
+            "forecast:end_time": end_str,
+            "forecast:leadtime_length": leadtime,
+        },
+        "links": [
+            {"rel": "self", "href": f"http://stac.local/collections/{collection_id}/items/{collection_id}_{reference_str[:10]}"},
+            {"rel": "collection", "href": f"http://stac.local/collections/{collection_id}"},
+            {"rel": "parent", "href": f"http://stac.local/collections/{collection_id}"},
+            {"rel": "root", "href": "http://stac.local/"},
+        ],
+        "assets": assets,
+    }
+
+
+def make_collection_items(collection_id: str, n_items: int, **kwargs) -> list[dict]:
+    """
+    Daily forecast items for `n_items` consecutive days from 2024-01-01.
+    """
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [make_item(collection_id, start + timedelta(days=day), **kwargs) for day in range(n_items)]
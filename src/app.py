@@ -1,8 +1,16 @@
+import hmac
+
 import dash
 import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
+import delivery
+import flask
+import metrics
+import profiling
+from config import METRICS_TOKEN
 from layouts import index
-from callbacks import map_callbacks
+from callbacks import background, catalog_cache, climatology, export, map_callbacks, previews
+from stac.snapshot import get_snapshot
 
 stylesheets = [
     "https://cdn.web.bas.ac.uk/bas-style-kit/0.7.3/css/bas-style-kit.min.css",
@@ -11,14 +19,45 @@ stylesheets = [
     dmc.styles.ALL,
 ]
 
-app = dash.Dash(__name__, external_stylesheets=[*stylesheets])
+app = dash.Dash(
+    __name__,
+    server=delivery.make_server(__name__),
+    compress=True,
+    external_stylesheets=delivery.stylesheet_urls(stylesheets),
+    background_callback_manager=background.manager,
+)
 app.title = "IceNet Visualiser"
 
+# Load the offline catalog snapshot (if configured) before serving any request
+get_snapshot()
+
 # Register the callbacks
 map_callbacks.register_callbacks(app)
 
 app.layout = index.layout
 server = app.server
+delivery.configure(app)
+catalog_cache.register_routes(server)
+previews.register_routes(server)
+export.register_routes(server)
+climatology.register_routes(server)
+profiling.register_routes(app)
+
+
+@server.route("/metrics")
+def metrics_endpoint():
+    """
+    Per-worker counters and gauges, e.g. coalesced upstream calls.
+
+    They name upstream URLs and show traffic, so they require the `METRICS_TOKEN`
+    bearer token, and the endpoint is disabled if it is unset.
+    """
+    if not METRICS_TOKEN:
+        flask.abort(404)
+    authorization = flask.request.headers.get("Authorization", "")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        flask.abort(401)
+    return flask.jsonify(metrics.snapshot())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,106 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Iterator
+
+import diskcache
+import psutil
+from config import BACKGROUND_CACHE_DIR, BACKGROUND_JOB_TIMEOUT, SHARED_JOB_RESULT_TTL
+from dash import DiskcacheManager
+
+logger = logging.getLogger(__name__)
+
+
+def _shared_result_window() -> int:
+    """
+    Time bucket added to every background job's cache key.
+
+    Jobs with identical arguments have identical cache keys, so every session
+    polling one receives the same result. Setting `cache_by` keeps results readable
+    until each of those sessions has read them, and this bucket makes new requests
+    compute fresh results every `SHARED_JOB_RESULT_TTL` seconds.
+    """
+    return int(time.time() // SHARED_JOB_RESULT_TTL)
+
+
+# Bumped by every pushed catalog invalidation (see `catalog_cache.publish`).
+CATALOG_GENERATION_KEY = "catalog-generation"
+
+
+def catalog_generation() -> int:
+    """
+    Number of catalog invalidations pushed so far.
+
+    Also part of every background job's cache key, so jobs started after an
+    invalidation never reuse results computed before it.
+    """
+    return cache.get(CATALOG_GENERATION_KEY, default=0)
+
+
+# Local disk-backed job manager for Dash background callbacks. The cache directory
+# is shared by all gunicorn workers on the host, so any worker can poll a job
+# started by another one.
+cache = diskcache.Cache(BACKGROUND_CACHE_DIR)
+manager = DiskcacheManager(cache, cache_by=[_shared_result_window, catalog_generation], expire=BACKGROUND_JOB_TIMEOUT)
+
+# How often a job waiting for another job's lock checks it again (seconds)
+_LOCK_POLL_INTERVAL = 0.05
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
+
+
+@contextmanager
+def _job_lock(key: Hashable) -> Iterator[None]:
+    """
+    Disk lock held by one job process at a time, storing the holder's pid.
+
+    Dash kills a job's process when a newer selection supersedes it, so the lock
+    may never be released. Waiters break a lock whose holder has died instead of
+    waiting for it to expire, and `BACKGROUND_JOB_TIMEOUT` still bounds a lock
+    held by a process that hangs.
+    """
+    lock_key = ("shared-job-lock", key)
+    pid = os.getpid()
+    while not cache.add(lock_key, pid, expire=BACKGROUND_JOB_TIMEOUT):
+        holder = cache.get(lock_key)
+        if holder is not None and not _process_alive(holder):
+            with cache.transact():
+                if cache.get(lock_key) == holder:
+                    logger.warning(f"Breaking the shared job lock of dead process {holder} for {key}")
+                    cache.delete(lock_key)
+            continue
+        time.sleep(_LOCK_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        with cache.transact():
+            if cache.get(lock_key) == pid:
+                cache.delete(lock_key)
+
+
+def shared_job(key: Hashable, fn: Callable[[], Any]) -> Any:
+    """
+    Run `fn` in one background job at a time for all jobs with the same `key`.
+
+    Results are only shared through Dash's cache keys (see `_shared_result_window`):
+    sessions requesting the same job poll the same key and all receive the first
+    result stored there, and Dash then cancels their own jobs. This lock only keeps
+    those jobs from walking the collections at the same time while they wait. A
+    job that gets the lock after the holder finished runs `fn` again until Dash
+    cancels it, so nothing is cached here.
+
+    Args:
+        key: Identity of the job, e.g. the STAC URL and the selected collection ids.
+        fn: Function computing the result.
+
+    Returns:
+        The result of `fn`.
+    """
+    with _job_lock(key):
+        return fn()
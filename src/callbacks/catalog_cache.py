@@ -0,0 +1,271 @@
+"""
+Long-lived catalog caches, kept fresh by pushed invalidations.
+
+The ingestion pipeline calls the invalidation hook whenever it adds or replaces
+items:
+
+    curl -X POST "$DASHBOARD/hooks/catalog" \
+        -H "Authorization: Bearer $INVALIDATION_TOKEN" \
+        -d '{"collection": "north_daily_forecast", "reference_times": ["2024-01-01T00:00:00Z"]}'
+
+Without the hook, a date index older than `LISTING_REVALIDATE_INTERVAL` is
+checked against a fingerprint of its collection (one single-item search) and only
+walked again if the collection changed.
+
+Leaving out `reference_times` invalidates the whole collection. Each hook call is
+appended to an invalidation log in the shared disk cache. The collection date
+indexes live in that cache too and are marked stale there once, then patched by
+refetching just the stale items on their next use. Every gunicorn worker replays
+new log entries before handling a callback or a request to a route that reads the
+catalog (exports, previews and anomaly tiles), and every background job before it
+starts, dropping the matching entries of its in-process item, statistics and
+datacube caches. Added or replaced items are
+then queued for tile cache warming (see `warming`) and added to their
+collection's climatology, if it has one (see `climatology`).
+"""
+import hmac
+import logging
+import os
+import threading
+import time
+from datetime import timezone
+
+import flask
+import metrics
+from config import INVALIDATION_TOKEN, ITEM_CACHE_TTL, LISTING_REVALIDATE_INTERVAL, STAC_FASTAPI_URL
+from dateutil import parser
+from stac import datacube
+from stac.process import STAC, invalidate_items
+from stac.summary import ItemSummary
+
+from . import climatology, previews, warming
+from .background import CATALOG_GENERATION_KEY, cache, catalog_generation
+from .export import EXPORT_ROUTE
+from .utils import invalidate_statistics
+
+logger = logging.getLogger(__name__)
+
+
+def _date_index_key(collection_id: str) -> tuple:
+    return ("date-index", STAC_FASTAPI_URL, collection_id)
+
+
+def _event_key(generation: int) -> tuple:
+    return ("catalog-invalidation", generation)
+
+
+def collection_item_summaries(stac, collection_id: str) -> list[ItemSummary]:
+    """
+    Item summaries of a collection, from the shared date index where possible.
+
+    A missing index is built by walking the collection, an old one is revalidated
+    and only walked again if the collection changed. Items marked stale by the
+    invalidation hook are refetched one by one and patched into the index.
+
+    Args:
+        stac: Catalog returned by `open_catalog`, without a viewport.
+        collection_id: Collection to list.
+
+    Returns:
+        The collection's item summaries, sorted by reference time.
+    """
+    if not isinstance(stac, STAC):
+        # Offline snapshots are already held in memory
+        return stac.get_collection_item_summaries(collection_id)
+
+    key = _date_index_key(collection_id)
+    index = cache.get(key)
+    if index is not None and time.time() - index.get("validated", 0) > LISTING_REVALIDATE_INTERVAL:
+        index = _revalidate(stac, collection_id, index)
+    if index is None:
+        # Fingerprint first, so changes made during the walk show up next time
+        fingerprint = stac.get_collection_fingerprint(collection_id)
+        summaries = stac.get_collection_item_summaries(collection_id)
+        cache.set(
+            key,
+            {"summaries": summaries, "stale": set(), "fingerprint": fingerprint, "validated": time.time()},
+            expire=ITEM_CACHE_TTL,
+        )
+        metrics.increment("catalog.date_index.built")
+        return summaries
+    if not index["stale"]:
+        return index["summaries"]
+
+    stale = set(index["stale"])
+    fingerprint = stac.get_collection_fingerprint(collection_id)
+    refreshed = {}
+    for reference_time in stale:
+        refreshed[reference_time] = stac.fetch_item_summary(
+            collection_id, reference_time.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        )
+    metrics.increment("catalog.date_index.patched", len(stale))
+
+    with cache.transact():
+        index = cache.get(key)
+        if index is None:
+            return stac.get_collection_item_summaries(collection_id)
+        by_time = {summary.reference_time: summary for summary in index["summaries"]}
+        for reference_time, summary in refreshed.items():
+            if summary is None:
+                by_time.pop(reference_time, None)
+            else:
+                by_time[reference_time] = summary
+        summaries = sorted(by_time.values(), key=lambda summary: summary.reference_time)
+        # Keep times marked stale again while these were being fetched
+        cache.set(
+            key,
+            {**index, "summaries": summaries, "stale": index["stale"] - stale, "fingerprint": fingerprint},
+            expire=ITEM_CACHE_TTL,
+        )
+    return summaries
+
+
+def _revalidate(stac, collection_id: str, index: dict) -> dict | None:
+    """
+    Check a date index against the current fingerprint of its collection.
+
+    Returns:
+        The index, with its TTL refreshed if the collection is unchanged, or
+        `None` if it has to be walked again.
+    """
+    try:
+        fingerprint = stac.get_collection_fingerprint(collection_id)
+    except Exception as e:
+        # Keep serving the cached index while the STAC API is unavailable
+        logger.warning(f"Could not revalidate the date index of {collection_id}: {e}")
+        return index
+    if fingerprint is None or fingerprint != index.get("fingerprint"):
+        metrics.increment("catalog.date_index.changed")
+        return None
+
+    metrics.increment("catalog.date_index.revalidated")
+    key = _date_index_key(collection_id)
+    with cache.transact():
+        # Keep times marked stale since `index` was read
+        current = cache.get(key)
+        if current is not None:
+            index = {**current, "validated": time.time()}
+            cache.set(key, index, expire=ITEM_CACHE_TTL)
+    return index
+
+
+def publish(collection_id: str, reference_times: list | None = None) -> int:
+    """
+    Record that items of a collection were added or replaced upstream.
+
+    Args:
+        collection_id: Collection the items belong to.
+        reference_times: Reference times (datetimes) of the changed items, `None`
+            for the whole collection.
+
+    Returns:
+        The catalog generation the invalidation was published as.
+    """
+    key = _date_index_key(collection_id)
+    with cache.transact():
+        index = cache.get(key)
+        hrefs = set()
+        if index is not None and reference_times is None:
+            hrefs = {href for summary in index["summaries"] for href in summary.asset_hrefs}
+            cache.delete(key)
+        elif index is not None:
+            hrefs = {
+                href
+                for summary in index["summaries"]
+                if summary.reference_time in reference_times
+                for href in summary.asset_hrefs
+            }
+            index["stale"] |= set(reference_times)
+            cache.set(key, index, expire=ITEM_CACHE_TTL)
+        generation = cache.incr(CATALOG_GENERATION_KEY)
+        event = {"collection_id": collection_id, "reference_times": reference_times, "hrefs": hrefs}
+        cache.set(_event_key(generation), event, expire=ITEM_CACHE_TTL)
+    previews.evict_previews(hrefs)
+    logger.info(f"Published catalog invalidation {generation} for {collection_id}")
+    return generation
+
+
+_applied_generation = catalog_generation()
+_apply_lock = threading.Lock()
+
+
+def _reset_apply_lock() -> None:
+    # A background job forked while another thread was replaying must not inherit its lock
+    global _apply_lock
+    _apply_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_apply_lock)
+
+# Routes besides Dash callbacks that read catalog data
+_CATALOG_ROUTES = (EXPORT_ROUTE, previews.PREVIEW_ROUTE, climatology.ANOMALY_ROUTE)
+
+
+def apply_pending() -> None:
+    """
+    Replay invalidations published since this process last checked.
+
+    Costs one shared cache read when nothing has changed. Called before callbacks
+    and catalog routes (see `register_routes`), and at the start of background jobs.
+    """
+    global _applied_generation
+    if catalog_generation() == _applied_generation:
+        return
+    with _apply_lock:
+        generation = catalog_generation()
+        for pending in range(_applied_generation + 1, generation + 1):
+            event = cache.get(_event_key(pending))
+            if event is None:
+                # Expired from the log, anything it covered has expired too
+                continue
+            hrefs = invalidate_items(event["collection_id"], event["reference_times"])
+            invalidate_statistics(hrefs | event["hrefs"])
+            datacube.evict(hrefs | event["hrefs"])
+            metrics.increment("catalog.invalidations.applied")
+        _applied_generation = max(_applied_generation, generation)
+
+
+def register_routes(server: flask.Flask) -> None:
+    """
+    Add the invalidation hook, and replay invalidations before every callback and
+    every request to a route that reads the catalog.
+    """
+
+    @server.before_request
+    def _apply_invalidations():
+        path = flask.request.path
+        if path.endswith("/_dash-update-component") or path.startswith(_CATALOG_ROUTES):
+            apply_pending()
+
+    @server.route("/hooks/catalog", methods=["POST"])
+    def catalog_invalidation_hook():
+        """
+        Invalidate cached items after they were added or replaced upstream.
+        """
+        if not INVALIDATION_TOKEN:
+            flask.abort(404)
+        authorization = flask.request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {INVALIDATION_TOKEN}".encode()):
+            flask.abort(401)
+
+        body = flask.request.get_json(force=True, silent=True) or {}
+        collection_id = body.get("collection")
+        if not isinstance(collection_id, str) or not collection_id:
+            return flask.jsonify(error="'collection' is required"), 400
+        reference_times = body.get("reference_times")
+        if reference_times is not None:
+            try:
+                reference_times = [parser.isoparse(value) for value in reference_times]
+                reference_times = [
+                    value if value.tzinfo else value.replace(tzinfo=timezone.utc) for value in reference_times
+                ]
+            except (TypeError, ValueError):
+                return flask.jsonify(error="'reference_times' must be a list of ISO 8601 datetimes"), 400
+
+        generation = publish(collection_id, reference_times)
+        apply_pending()
+        if reference_times is not None:
+            published = [value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") for value in reference_times]
+            warming.schedule(collection_id, published)
+            climatology.schedule(collection_id, published)
+        return flask.jsonify(generation=generation), 202
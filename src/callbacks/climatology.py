@@ -0,0 +1,492 @@
+"""
+Climatologies of past forecasts, and anomaly tiles against them.
+
+The climatology of a forecast is the mean of its collection's forecasts from
+earlier years for the same leadtime and day of year (of the forecast reference
+time), per band. A forecast is never part of its own climatology, nor are later
+forecasts. Days are calendar dates, with February 29 counted as February 28, so a
+day is the same date in leap and other years.
+
+It is kept as low resolution sums and counts per year, updated once per new item
+instead of being recomputed over years of COGs per request:
+
+    CLIMATOLOGY_DIR/<collection>/grid.json                   shared low resolution grid
+    CLIMATOLOGY_DIR/<collection>/ledger.json                 leadtimes included, by reference time
+    CLIMATOLOGY_DIR/<collection>/band<b>_lt<l>_<year>.npy    (365 days, [count, sum], y, x)
+
+The `.npy` files are memory-mapped, so tile requests page in only the day they
+need, and unused days take no disk space.
+
+Anomaly tiles are the forecast tile minus the climatology reprojected onto it,
+rendered in the dashboard with the layer's colormap and rescale and cached in
+the shared disk cache like previews.
+
+Items named by the catalog invalidation hook are added as they are published.
+To build or backfill a collection's climatology from all of its items (from `src/`):
+
+    python -m callbacks.climatology north_daily_forecast
+"""
+import argparse
+import functools
+import json
+import logging
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timezone
+from urllib.parse import quote, urlencode
+
+import diskcache
+import flask
+import metrics
+import numpy as np
+import rasterio
+from affine import Affine
+from config import CLIMATOLOGY_DIR, CLIMATOLOGY_SIZE, STAC_FASTAPI_URL, STATISTICS_CACHE_TTL
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds
+from rasterio.warp import reproject
+from rio_tiler.colormap import cmap
+from rio_tiler.errors import TileOutsideBounds
+from rio_tiler.io import Reader
+from rio_tiler.models import ImageData
+from stac.process import open_catalog
+from stac.summary import ItemSummary
+
+from .background import cache
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_ROUTE = "/climatology/anomaly"
+DAYS = 365
+
+# One update job at a time per worker, plus a host-wide lock per collection
+_jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix="climatology")
+_ledger_lock = threading.Lock()
+
+
+def _collection_dir(collection_id: str) -> str:
+    return os.path.join(CLIMATOLOGY_DIR, quote(collection_id, safe=""))
+
+
+def _day_of_year(summary: ItemSummary) -> int:
+    """
+    0-based day of year of an item's reference time in a non-leap year, with
+    February 29 counted as February 28.
+    """
+    reference_time = summary.reference_time.astimezone(timezone.utc)
+    day = min(reference_time.day, 28) if reference_time.month == 2 else reference_time.day
+    return date(2001, reference_time.month, day).timetuple().tm_yday - 1
+
+
+def _year(summary: ItemSummary) -> int:
+    return summary.reference_time.astimezone(timezone.utc).year
+
+
+def _iso(summary: ItemSummary) -> str:
+    return summary.reference_time.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class Grid:
+    """
+    Low resolution grid a collection's climatology is stored on.
+
+    Attributes:
+        crs: CRS of the collection's COGs.
+        transform: Affine transform of the low resolution grid.
+        width: Columns.
+        height: Rows.
+        source_shape: `(height, width)` of the full resolution COGs.
+    """
+
+    __slots__ = ("crs", "transform", "width", "height", "source_shape")
+
+    def __init__(self, crs: CRS, transform: Affine, width: int, height: int, source_shape: tuple[int, int]) -> None:
+        self.crs = crs
+        self.transform = transform
+        self.width = width
+        self.height = height
+        self.source_shape = source_shape
+
+    @classmethod
+    def for_dataset(cls, dataset: rasterio.DatasetReader, size: int) -> "Grid":
+        """
+        The grid of a COG downsampled to at most `size` pixels along its longest side.
+        """
+        scale = max(1.0, max(dataset.width, dataset.height) / size)
+        width, height = math.ceil(dataset.width / scale), math.ceil(dataset.height / scale)
+        transform = dataset.transform * Affine.scale(dataset.width / width, dataset.height / height)
+        return cls(dataset.crs, transform, width, height, (dataset.height, dataset.width))
+
+    def matches(self, dataset: rasterio.DatasetReader) -> bool:
+        """
+        Whether a COG covers the same full resolution grid the climatology was built from.
+        """
+        scaled = self.transform * Affine.scale(self.width / dataset.width, self.height / dataset.height)
+        return (
+            dataset.crs == self.crs
+            and (dataset.height, dataset.width) == self.source_shape
+            and scaled.almost_equals(dataset.transform)
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "crs": self.crs.to_wkt(),
+            "transform": list(self.transform)[:6],
+            "width": self.width,
+            "height": self.height,
+            "source_shape": list(self.source_shape),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Grid":
+        return cls(
+            CRS.from_wkt(data["crs"]),
+            Affine(*data["transform"]),
+            data["width"],
+            data["height"],
+            tuple(data["source_shape"]),
+        )
+
+
+def _write_json(path: str, data) -> None:
+    # Replace atomically, readers never see a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def load_grid(collection_id: str) -> Grid | None:
+    path = os.path.join(_collection_dir(collection_id), "grid.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return Grid.from_dict(json.load(f))
+
+
+def load_ledger(collection_id: str) -> dict[str, int]:
+    """
+    Number of leadtimes of each reference time already included in a collection's
+    climatology. Leadtimes are added in order, so an item is complete once all of
+    its leadtimes are counted.
+    """
+    path = os.path.join(_collection_dir(collection_id), "ledger.json")
+    if not os.path.exists(path):
+        return {}
+    with _ledger_lock, open(path) as f:
+        return json.load(f)
+
+
+def _array_path(collection_id: str, band_index: int, leadtime: int, year: int) -> str:
+    return os.path.join(_collection_dir(collection_id), f"band{band_index}_lt{leadtime:03d}_{year}.npy")
+
+
+def _array_years(collection_id: str, band_index: int, leadtime: int) -> list[int]:
+    """
+    Years with forecasts of a band at a leadtime.
+    """
+    pattern = re.compile(rf"band{band_index}_lt{leadtime:03d}_(\d+)\.npy")
+    try:
+        names = os.listdir(_collection_dir(collection_id))
+    except FileNotFoundError:
+        return []
+    return sorted(int(match.group(1)) for match in map(pattern.fullmatch, names) if match)
+
+
+def _open_for_update(collection_id: str, band_index: int, leadtime: int, year: int, grid: Grid) -> np.memmap:
+    path = _array_path(collection_id, band_index, leadtime, year)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode="r+")
+    # Allocated sparsely, days without forecasts take no disk space
+    return np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(DAYS, 2, grid.height, grid.width))
+
+
+@functools.lru_cache(maxsize=256)
+def _open_for_reading(path: str, mtime_ns: int) -> np.memmap:
+    # `mtime_ns` is only part of the key, so a recreated file is mapped again
+    return np.load(path, mmap_mode="r")
+
+
+def climatology_mean(
+    collection_id: str, band_index: int, leadtime: int, day_of_year: int, before_year: int
+) -> np.ndarray | None:
+    """
+    Climatological mean of a band at a leadtime and 0-based day of year over the
+    years before `before_year`, on the collection's grid (see `load_grid`), NaN
+    where no forecast of those years had data.
+
+    Returns:
+        The mean, or `None` if there is no climatology for this leadtime and day.
+    """
+    count = total = None
+    for year in _array_years(collection_id, band_index, leadtime):
+        if year >= before_year:
+            break
+        path = _array_path(collection_id, band_index, leadtime, year)
+        try:
+            days = _open_for_reading(path, os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            continue
+        year_count, year_total = days[day_of_year].astype(np.float64)
+        count = year_count if count is None else count + year_count
+        total = year_total if total is None else total + year_total
+    if count is None or not count.any():
+        return None
+    return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def climatology_version(collection_id: str) -> int:
+    """
+    Number of leadtimes of items in a collection's climatology, 0 if there is none.
+    """
+    return sum(load_ledger(collection_id).values())
+
+
+def add_item(summary: ItemSummary) -> bool:
+    """
+    Add every leadtime and band of an item to its collection's climatology.
+
+    The sums and counts of the item's year are updated in place wherever it has
+    data. Every COG is read before any of them is added, so an item with a COG that
+    cannot be read or is off the grid leaves the climatology unchanged. Each
+    leadtime is recorded in the ledger as soon as it is added, and only leadtimes
+    not recorded yet are added, so the climatology can be rebuilt incrementally and
+    an interrupted update resumes without adding a leadtime twice.
+
+    Returns:
+        Whether the item was added.
+    """
+    collection_id = summary.collection_id
+    if summary.reference_time is None or not summary.asset_hrefs:
+        return False
+    os.makedirs(_collection_dir(collection_id), exist_ok=True)
+
+    # Serialises updates of a collection across the workers of this host
+    with diskcache.Lock(cache, f"climatology-lock:{collection_id}", expire=3600):
+        ledger = load_ledger(collection_id)
+        reference_time = _iso(summary)
+        added = ledger.get(reference_time, 0)
+        if added >= len(summary.asset_hrefs):
+            return False
+        grid = load_grid(collection_id)
+        new_grid = grid is None
+        day, year = _day_of_year(summary), _year(summary)
+
+        leadtime_values = []
+        for cog_href in summary.asset_hrefs[added:]:
+            with rasterio.open(cog_href) as dataset:
+                if grid is None:
+                    grid = Grid.for_dataset(dataset, CLIMATOLOGY_SIZE)
+                if not grid.matches(dataset):
+                    logger.warning(f"{cog_href} is not on the climatology grid of {collection_id}, skipped")
+                    return False
+                bands = sorted(set(summary.band_map.values())) or list(dataset.indexes)
+                # GDAL reads the closest overview for the low resolution shape
+                values = dataset.read(
+                    bands,
+                    out_shape=(len(bands), grid.height, grid.width),
+                    resampling=Resampling.average,
+                    masked=True,
+                ).astype(np.float32).filled(np.nan)
+            leadtime_values.append((bands, values))
+
+        if new_grid:
+            _write_json(os.path.join(_collection_dir(collection_id), "grid.json"), grid.to_dict())
+        for leadtime, (bands, values) in enumerate(leadtime_values, start=added):
+            for band_index, band_values in zip(bands, values):
+                days = _open_for_update(collection_id, band_index, leadtime, year, grid)
+                count, total = days[day, 0], days[day, 1]
+                valid = np.isfinite(band_values)
+                count[valid] += 1
+                total[valid] += band_values[valid]
+                days.flush()
+                del days
+            ledger[reference_time] = leadtime + 1
+            with _ledger_lock:
+                _write_json(os.path.join(_collection_dir(collection_id), "ledger.json"), ledger)
+    metrics.increment("climatology.items_added")
+    logger.info(f"Added {collection_id} {reference_time} to its climatology")
+    return True
+
+
+def build(collection_id: str) -> int:
+    """
+    Add every item of a collection not yet in its climatology.
+
+    Returns:
+        Number of items added.
+    """
+    from .catalog_cache import collection_item_summaries
+
+    stac = open_catalog(STAC_FASTAPI_URL)
+    added = 0
+    for summary in collection_item_summaries(stac, collection_id):
+        try:
+            added += add_item(summary)
+        except Exception as e:
+            logger.warning(f"Could not add {collection_id} {summary.reference_time} to its climatology: {e}")
+    return added
+
+
+def _add_logged(collection_id: str, forecast_reference_time: str) -> None:
+    try:
+        summary = open_catalog(STAC_FASTAPI_URL).get_item_summary(collection_id, forecast_reference_time)
+        add_item(summary)
+    except Exception as e:
+        logger.error(f"Climatology update with {collection_id} {forecast_reference_time} failed: {e}")
+
+
+def schedule(collection_id: str, forecast_reference_times: list[str]) -> None:
+    """
+    Queue newly published items to be added to their climatology, in a background thread.
+
+    Only collections that already have a climatology are updated, use `build` to start one.
+    """
+    if load_grid(collection_id) is None:
+        return
+    for forecast_reference_time in forecast_reference_times:
+        _jobs.submit(_add_logged, collection_id, forecast_reference_time)
+
+
+def get_anomaly_tile_url(
+    collection_id: str,
+    summary: ItemSummary,
+    leadtime: int,
+    colormap: str,
+    band_index: int,
+    min_val: float,
+    max_val: float,
+) -> str:
+    """
+    Tile URL template of a layer showing a forecast's anomaly against its climatology.
+
+    The item is named by its reference time, and the COG is looked up in the catalog
+    when a tile is rendered, so tile requests cannot make the server open other
+    files. The climatology version is part of the URL, so tiles are rerendered once
+    it changes.
+    """
+    return ANOMALY_ROUTE + "/{z}/{x}/{y}.png?" + urlencode({
+        "collection": collection_id,
+        "reference_time": _iso(summary),
+        "leadtime": leadtime,
+        "bidx": band_index,
+        "colormap_name": colormap,
+        "rescale": f"{min_val},{max_val}",
+        "v": climatology_version(collection_id),
+    })
+
+
+def render_anomaly_tile(
+    summary: ItemSummary,
+    band_index: int,
+    leadtime: int,
+    z: int,
+    x: int,
+    y: int,
+    colormap: str,
+    rescale: tuple[float, float],
+) -> bytes | None:
+    """
+    PNG of a forecast tile minus the climatology of the years before the
+    forecast's, or `None` if either is missing there.
+    """
+    collection_id = summary.collection_id
+    grid = load_grid(collection_id)
+    expected = climatology_mean(collection_id, band_index, leadtime, _day_of_year(summary), _year(summary))
+    if grid is None or expected is None:
+        return None
+    try:
+        with Reader(summary.asset_hrefs[leadtime]) as cog:
+            forecast = cog.tile(x, y, z, indexes=band_index)
+    except TileOutsideBounds:
+        return None
+
+    # Bilinear upsampling of the climatology onto the tile
+    tile_expected = np.full((forecast.height, forecast.width), np.nan, dtype=np.float32)
+    reproject(
+        expected.astype(np.float32),
+        tile_expected,
+        src_transform=grid.transform,
+        src_crs=grid.crs,
+        src_nodata=np.nan,
+        dst_transform=from_bounds(*forecast.bounds, forecast.width, forecast.height),
+        dst_crs=forecast.crs,
+        dst_nodata=np.nan,
+        resampling=Resampling.bilinear,
+    )
+    anomaly = np.ma.masked_invalid(forecast.array[0].astype(np.float32).filled(np.nan) - tile_expected)
+    image = ImageData(anomaly[np.newaxis], bounds=forecast.bounds, crs=forecast.crs)
+    image.rescale(in_range=(rescale,))
+    return image.render(img_format="PNG", colormap=cmap.get(colormap))
+
+
+def get_anomaly_tile(args: dict, z: int, x: int, y: int) -> bytes | None:
+    """
+    Cached `render_anomaly_tile` for the query string of an anomaly tile URL.
+
+    Returns:
+        The PNG, or `None` if the item, leadtime, forecast or climatology is missing.
+
+    Raises:
+        KeyError, ValueError: If a parameter is missing or malformed.
+    """
+    key = ("anomaly-tile", tuple(sorted(args.items())), z, x, y)
+    png = cache.get(key)
+    if png is None:
+        collection_id, forecast_reference_time = args["collection"], args["reference_time"]
+        band_index, leadtime = int(args["bidx"]), int(args["leadtime"])
+        rescale = tuple(float(value) for value in args["rescale"].split(","))
+        try:
+            summary = open_catalog(STAC_FASTAPI_URL).get_item_summary(collection_id, forecast_reference_time)
+        except ValueError:
+            return None
+        if not 0 <= leadtime < len(summary.asset_hrefs):
+            return None
+        png = render_anomaly_tile(summary, band_index, leadtime, z, x, y, args["colormap_name"], rescale)
+        if png is not None:
+            # Tagged like previews, so replaced COGs are evicted by the invalidation hook
+            cache.set(key, png, expire=STATISTICS_CACHE_TTL, tag=summary.asset_hrefs[leadtime])
+            metrics.increment("climatology.tiles_rendered")
+    return png
+
+
+def register_routes(server: flask.Flask) -> None:
+    """
+    Serve anomaly tiles at `ANOMALY_ROUTE/<z>/<x>/<y>.png`.
+    """
+
+    @server.route(f"{ANOMALY_ROUTE}/<int:z>/<int:x>/<int:y>.png")
+    def anomaly_tile(z: int, x: int, y: int):
+        try:
+            png = get_anomaly_tile(flask.request.args.to_dict(), z, x, y)
+        except (KeyError, ValueError):
+            flask.abort(400)
+        except Exception as e:
+            logger.warning(
+                f"Anomaly tile {z}/{x}/{y} of {flask.request.args.get('collection')} "
+                f"{flask.request.args.get('reference_time')} failed: {e}"
+            )
+            flask.abort(502)
+        if png is None:
+            flask.abort(404)
+        response = flask.Response(png, mimetype="image/png")
+        response.headers["Cache-Control"] = f"public, max-age={int(STATISTICS_CACHE_TTL)}"
+        return response
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description="Build or update the climatology of a collection.")
+    argparser.add_argument("collection", help="Collection id")
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    added = build(args.collection)
+    logger.info(f"Added {added} items to the climatology of {args.collection}")
+
+
+if __name__ == "__main__":
+    main()
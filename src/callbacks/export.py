@@ -0,0 +1,274 @@
+"""
+Streamed data export of the current map view.
+
+Downloads one variable of an item over a bbox, for one leadtime or all of them,
+as NetCDF or CSV. The region is cut lazily out of the item's datacube (see
+`stac.datacube`) and read from the COGs `DATACUBE_CHUNK_SIZE` rows at a time by
+a generator that writes each block to the response as it goes, so a worker
+never holds more than one block of the export in memory.
+
+NetCDF exports use the classic 64-bit offset format, whose layout is known
+before any data is read: the header first, then the coordinates, then one record
+per leadtime.
+"""
+import csv
+import io
+import logging
+import struct
+from typing import Iterator
+from urllib.parse import urlencode
+
+import flask
+import metrics
+import numpy as np
+import xarray as xr
+from config import DATACUBE_CHUNK_SIZE, EXPORT_MAX_CELLS, STAC_FASTAPI_URL
+from rasterio.warp import transform, transform_bounds
+from rioxarray.exceptions import NoDataInBounds
+from stac import datacube
+from stac.process import open_catalog
+
+logger = logging.getLogger(__name__)
+
+EXPORT_ROUTE = "/exports/view"
+FORMATS = {"nc": "application/x-netcdf", "csv": "text/csv"}
+
+
+def get_export_url(
+    collection_id: str, forecast_reference_time: str, band_index: int, bbox, leadtime: int | None, fmt: str
+) -> str:
+    """
+    Dashboard URL of an export of the current view.
+
+    Args:
+        collection_id: Collection of the item.
+        forecast_reference_time: 'forecast:reference_time' of the item.
+        band_index: 1-based band index of the variable.
+        bbox: `(west, south, east, north)` in degrees, `None` for the whole item.
+        leadtime: Leadtime to export, `None` for all of them.
+        fmt: One of `FORMATS`.
+    """
+    params = {"collection": collection_id, "reference_time": forecast_reference_time, "bidx": band_index}
+    if bbox is not None:
+        params["bbox"] = ",".join(f"{value:.6f}" for value in bbox)
+    if leadtime is not None:
+        params["leadtime"] = leadtime
+    return f"{EXPORT_ROUTE}.{fmt}?{urlencode(params)}"
+
+
+def export_region(cube: xr.DataArray, bbox, band_index: int, leadtimes: list[int]) -> xr.DataArray:
+    """
+    Lazy `(leadtime, y, x)` cut of a datacube, nothing is read yet.
+
+    Raises:
+        NoDataInBounds: If the bbox does not overlap the item.
+    """
+    region = cube.sel(band=band_index).isel(leadtime=leadtimes)
+    if bbox is None:
+        return region
+    west, south, east, north = bbox
+    if west > east:
+        # Crossing the antimeridian, take the full longitude range between the latitudes
+        west, east = -180.0, 180.0
+    return region.rio.clip_box(*transform_bounds("EPSG:4326", cube.rio.crs, west, south, east, north))
+
+
+def _row_blocks(region: xr.DataArray, leadtime_position: int) -> Iterator[tuple[slice, np.ndarray]]:
+    """
+    Rows of one leadtime of the region, read `DATACUBE_CHUNK_SIZE` at a time.
+    """
+    for start in range(0, region.sizes["y"], DATACUBE_CHUNK_SIZE):
+        rows = slice(start, start + DATACUBE_CHUNK_SIZE)
+        block = region.isel(leadtime=leadtime_position, y=rows).values
+        metrics.increment("export.blocks")
+        yield rows, block
+
+
+def stream_csv(region: xr.DataArray, variable: str) -> Iterator[bytes]:
+    """
+    CSV export, one line per valid pixel: leadtime, projected x/y, lon/lat and value.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["leadtime", "x", "y", "lon", "lat", variable])
+    x = region.x.values
+    for position, leadtime in enumerate(region.leadtime.values):
+        for rows, block in _row_blocks(region, position):
+            row_index, col_index = np.nonzero(np.isfinite(block))
+            xs, ys = x[col_index], region.y.values[rows][row_index]
+            lons, lats = transform(region.rio.crs, "EPSG:4326", xs, ys) if len(xs) else ([], [])
+            writer.writerows(
+                zip([int(leadtime)] * len(xs), xs, ys, np.round(lons, 6), np.round(lats, 6), block[row_index, col_index])
+            )
+            if buffer.tell():
+                yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+
+# NetCDF classic format tags and types, see
+# https://docs.unidata.ucar.edu/netcdf-c/current/file_format_specifications.html
+_NC_DIMENSION, _NC_VARIABLE, _NC_ATTRIBUTE = 0x0A, 0x0B, 0x0C
+_NC_CHAR, _NC_INT, _NC_FLOAT, _NC_DOUBLE = 2, 4, 5, 6
+_NC_DTYPES = {_NC_INT: ">i4", _NC_FLOAT: ">f4", _NC_DOUBLE: ">f8"}
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b"\x00" * (-len(data) % 4)
+
+
+def _nc_name(name: str) -> bytes:
+    encoded = name.encode()
+    return struct.pack(">i", len(encoded)) + _pad(encoded)
+
+
+def _nc_attributes(attrs: dict) -> bytes:
+    if not attrs:
+        return b"\x00" * 8
+    out = struct.pack(">ii", _NC_ATTRIBUTE, len(attrs))
+    for name, value in attrs.items():
+        if isinstance(value, str):
+            encoded = value.encode()
+            out += _nc_name(name) + struct.pack(">ii", _NC_CHAR, len(encoded)) + _pad(encoded)
+        else:
+            nc_type = _NC_FLOAT if isinstance(value, np.float32) else _NC_DOUBLE if isinstance(value, float) else _NC_INT
+            out += _nc_name(name) + struct.pack(">ii", nc_type, 1) + _pad(np.array([value], _NC_DTYPES[nc_type]).tobytes())
+    return out
+
+
+def _nc_header(dims: list[tuple[str, int]], variables: list[tuple], global_attrs: dict, numrecs: int) -> bytes:
+    """
+    Header of a 64-bit offset NetCDF file, with the data offsets filled in.
+
+    Args:
+        dims: `(name, length)` of each dimension, the first with length 0 is the record dimension.
+        variables: `(name, dim ids, attrs, nc type, vsize, is record)` of each variable,
+            fixed size variables first.
+        global_attrs: File attributes.
+        numrecs: Number of records.
+    """
+    def _build(begins: list[int]) -> bytes:
+        out = b"CDF\x02" + struct.pack(">i", numrecs)
+        out += struct.pack(">ii", _NC_DIMENSION, len(dims))
+        for name, length in dims:
+            out += _nc_name(name) + struct.pack(">i", length)
+        out += _nc_attributes(global_attrs)
+        out += struct.pack(">ii", _NC_VARIABLE, len(variables))
+        for (name, dim_ids, attrs, nc_type, vsize, _), begin in zip(variables, begins):
+            out += _nc_name(name) + struct.pack(">i", len(dim_ids))
+            out += b"".join(struct.pack(">i", dim_id) for dim_id in dim_ids)
+            out += _nc_attributes(attrs) + struct.pack(">iiq", nc_type, vsize, begin)
+        return out
+
+    # The header length does not depend on the offsets, so build it once to measure
+    offset = len(_build([0] * len(variables)))
+    begins = []
+    for *_, vsize, is_record in variables:
+        if not is_record:
+            begins.append(offset)
+            offset += vsize
+    for *_, vsize, is_record in variables:
+        if is_record:
+            begins.append(offset)
+            offset += vsize
+    return _build(begins)
+
+
+def stream_netcdf(region: xr.DataArray, variable: str, global_attrs: dict) -> Iterator[bytes]:
+    """
+    NetCDF export, CF-style with a `spatial_ref` grid mapping that rioxarray and GIS tools read.
+    """
+    ny, nx = region.sizes["y"], region.sizes["x"]
+    crs = region.rio.crs
+    dims = [("leadtime", 0), ("y", ny), ("x", nx)]
+    variables = [
+        ("x", [2], {"standard_name": "projection_x_coordinate", "axis": "X"}, _NC_DOUBLE, 8 * nx, False),
+        ("y", [1], {"standard_name": "projection_y_coordinate", "axis": "Y"}, _NC_DOUBLE, 8 * ny, False),
+        ("spatial_ref", [], {"crs_wkt": crs.to_wkt(), "spatial_ref": crs.to_wkt()}, _NC_INT, 4, False),
+        ("leadtime", [0], {"long_name": "days since the forecast reference time", "units": "days"}, _NC_INT, 4, True),
+        (variable, [0, 1, 2], {"_FillValue": np.float32(np.nan), "grid_mapping": "spatial_ref"}, _NC_FLOAT, 4 * ny * nx, True),
+    ]
+    yield _nc_header(dims, variables, global_attrs, region.sizes["leadtime"])
+    yield region.x.values.astype(">f8").tobytes()
+    yield region.y.values.astype(">f8").tobytes()
+    yield struct.pack(">i", 0)
+    for position, leadtime in enumerate(region.leadtime.values):
+        yield struct.pack(">i", int(leadtime))
+        for _, block in _row_blocks(region, position):
+            yield block.astype(">f4").tobytes()
+
+
+def _variable_name(band_map: dict[str, int], band_index: int) -> str:
+    names = [name for name, index in band_map.items() if index == band_index]
+    return names[0] if names else f"band_{band_index}"
+
+
+def register_routes(server: flask.Flask) -> None:
+    """
+    Serve exports at `EXPORT_ROUTE.<format>`.
+    """
+
+    @server.route(f"{EXPORT_ROUTE}.<fmt>")
+    def export_view(fmt: str):
+        if fmt not in FORMATS:
+            flask.abort(404)
+        args = flask.request.args
+        try:
+            collection_id = args["collection"]
+            forecast_reference_time = args["reference_time"]
+            band_index = int(args["bidx"])
+            bbox = [float(value) for value in args["bbox"].split(",")] if "bbox" in args else None
+            leadtime = int(args["leadtime"]) if "leadtime" in args else None
+        except (KeyError, ValueError):
+            flask.abort(400)
+        if bbox is not None and len(bbox) != 4:
+            flask.abort(400)
+
+        stac = open_catalog(STAC_FASTAPI_URL)
+        try:
+            summary = stac.get_item_summary(collection_id, forecast_reference_time)
+        except ValueError as e:
+            return flask.jsonify(error=str(e)), 404
+        n_leadtimes = len(summary.asset_hrefs)
+        if leadtime is not None and not 0 <= leadtime < n_leadtimes:
+            return flask.jsonify(error=f"Leadtime {leadtime} out of range"), 404
+
+        # Only open the COGs of the exported leadtimes, not every COG of the item
+        leadtimes = list(range(n_leadtimes)) if leadtime is None else [leadtime]
+        try:
+            cube = datacube.open_cube([summary.asset_hrefs[index] for index in leadtimes])
+            cube = cube.assign_coords(leadtime=leadtimes)
+            region = export_region(cube, bbox, band_index, list(range(len(leadtimes))))
+        except NoDataInBounds:
+            return flask.jsonify(error="The view does not overlap the item"), 404
+        except KeyError:
+            return flask.jsonify(error=f"No band {band_index}"), 404
+
+        cells = region.sizes["leadtime"] * region.sizes["y"] * region.sizes["x"]
+        if cells > EXPORT_MAX_CELLS:
+            return flask.jsonify(
+                error=f"Export of {cells} values exceeds the limit of {EXPORT_MAX_CELLS}, zoom in or pick one leadtime"
+            ), 413
+
+        variable = _variable_name(summary.band_map, band_index)
+        if fmt == "csv":
+            body = stream_csv(region, variable)
+        else:
+            body = stream_netcdf(region, variable, {
+                "Conventions": "CF-1.8",
+                "title": f"{collection_id} {variable}",
+                "source": summary.item_id or "",
+                "forecast_reference_time": forecast_reference_time,
+            })
+        metrics.increment(f"export.{fmt}")
+        logger.info(f"Exporting {cells} values of {collection_id} {forecast_reference_time} as {fmt}")
+
+        filename = "_".join([
+            collection_id,
+            summary.reference_time.strftime("%Y%m%d") if summary.reference_time else forecast_reference_time[:10],
+            variable,
+            "all" if leadtime is None else f"leadtime{leadtime}",
+        ])
+        response = flask.Response(flask.stream_with_context(body), mimetype=FORMATS[fmt])
+        response.headers["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+        return response
@@ -6,15 +6,34 @@ from urllib.parse import urlparse, urlunparse
 import dash
 import dash_leaflet as dl
 import pandas as pd
-from config import STAC_FASTAPI_URL, TILER_URL
+from config import (
+    BACKGROUND_JOB_TIMEOUT,
+    CALLBACK_TIME_BUDGET,
+    LEADTIME_COMMIT_DELAY_MS,
+    STAC_FASTAPI_URL,
+    TILER_URL,
+)
 from datetime import datetime, timedelta
-from dash import ALL, MATCH, Input, Output, State, no_update
-from pystac.utils import datetime_to_str, str_to_datetime
+from dash import ALL, MATCH, Input, Output, State, html, no_update
+from pystac.utils import str_to_datetime
 from stac.process import (
-    STAC,
+    open_catalog,
+)
+from stac.resilience import Deadline, DeadlineExceeded
+from stac.spatial import SpatialIndex, leaflet_bounds_to_bbox
+
+from . import supersede
+from .background import catalog_generation, shared_job
+from .catalog_cache import apply_pending, collection_item_summaries
+from .climatology import get_anomaly_tile_url
+from .export import get_export_url
+from .previews import get_preview_url, preview_bounds
+from .utils import (
+    convert_colormap_to_colorscale,
+    get_cog_band_statistics_many,
+    get_layer_tile_url,
+    round_2dp,
 )
-
-from .utils import convert_colormap_to_colorscale, get_cog_band_statistics, round_2dp
 
 
 def normalise_url_path(url: str) -> str:
@@ -38,24 +57,112 @@ def normalise_url_path(url: str) -> str:
     return urlunparse(parts._replace(path=normalised_path))
 
 
-# Function to generate tile URL for a STAC Item
-def get_tile_url(cog_path: str):
+# Spatial extents of the catalog's collections, filled from 'collections-store'
+collection_index = SpatialIndex()
+
+
+def visible_collections(collection_ids: list, bbox) -> list:
     """
-    Returns the tile URL for the given STAC Item (i.e. COG path).
+    Filters `collection_ids` down to those whose extent intersects `bbox`.
+
+    Collections not yet in the spatial index are kept, since nothing is known about
+    their extent.
+    """
+    if bbox is None:
+        return list(collection_ids)
+    visible = collection_index.query(bbox)
+    return [c for c in collection_ids if c in visible or c not in collection_index]
+
+
+def build_pane_layers(
+    pane: str,
+    collection_ids: list,
+    summaries: dict,
+    cog_hrefs: dict[str, str],
+    band_stats: dict,
+    band_index: int,
+    fixed_range: tuple[float, float] | None,
+    colormap: str,
+    layer_mode: str,
+    leadtime: int,
+) -> tuple[list, list[float], list[float]]:
+    """
+    Map layers of one pane, from the item manifest and statistics shared by all panes.
 
     Args:
-        cog_path: The path to the Cloud Optimized GeoTIFF file relative to `DATA_URL`.
+        pane: 'main' or 'compare', keeps the layer ids of the panes apart.
+        collection_ids: Collections shown in this pane.
+        summaries: Item summary (or lookup error) per collection.
+        cog_hrefs: COG of the selected leadtime per collection that has one.
+        band_stats: Band statistics (or lookup error) per `(COG href, band index)`.
+        band_index: Variable shown in this pane.
+        fixed_range: Fixed rescale range, `None` to rescale to each COG's statistics.
+        colormap: The selected colormap.
+        layer_mode: 'forecast' or 'anomaly'.
+        leadtime: The committed leadtime.
 
     Returns:
-        The URL using the specified tiler and format, with placeholders for z, x, y.
-
-    Raises:
-        None
+        The Overlay layers, and the min and max values they are rescaled to.
     """
-    return f"{TILER_URL}/cog/tiles/WebMercatorQuad/{{z}}/{{x}}/{{y}}?url={cog_path}"
-    # To return tiles back in EPSG:6931
-    # Useful when Leaflet reprojection code is working.
-    # return f"{TILER_URL}/cog/tiles/EPSG6931/{{z}}/{{x}}/{{y}}?url={cog_path}"
+    tile_layers = []
+    min_vals = []
+    max_vals = []
+    for idx, collection_id in enumerate(c for c in collection_ids if c in cog_hrefs):
+        summary = summaries[collection_id]
+        cog_href = cog_hrefs[collection_id]
+        # Layer ids of the main pane are kept as they were before split-map mode
+        layer_index = idx if pane == "main" else f"{pane}-{idx}"
+
+        # Determine rescale range
+        if fixed_range is not None:
+            min_val, max_val = fixed_range
+        else:
+            stats = band_stats[(cog_href, band_index)]
+            if isinstance(stats, Exception):
+                logging.error(f"Error processing collection {collection_id}: {stats}")
+                continue
+            min_val = stats.get("min", 0)
+            max_val = stats.get("max", 1)
+
+        if layer_mode == "anomaly" and fixed_range is None:
+            # Centred on zero, spanning as much as the forecast itself
+            half_range = (max_val - min_val) / 2
+            min_val, max_val = -half_range, half_range
+
+        min_val, max_val = round_2dp(min_val), round_2dp(max_val)
+        min_vals.append(min_val)
+        max_vals.append(max_val)
+
+        if layer_mode == "anomaly":
+            tile_url = get_anomaly_tile_url(
+                collection_id, summary, leadtime, colormap, band_index, min_val, max_val
+            )
+        else:
+            tile_url = get_layer_tile_url(cog_href, colormap, band_index, min_val, max_val)
+
+        # Low resolution preview underneath the tiles, painted in one request
+        layers = []
+        if summary.bbox and layer_mode != "anomaly":
+            layers.append(
+                dl.ImageOverlay(
+                    id={"type": "cog-preview", "index": layer_index},
+                    url=get_preview_url(cog_href, colormap, band_index, min_val, max_val, summary.bbox),
+                    bounds=preview_bounds(summary.bbox),
+                    pane="tilePane",
+                    zIndex=idx,
+                    opacity=1,
+                )
+            )
+        layers.append(
+            dl.TileLayer(
+                id={"type": "cog-collections", "index": layer_index},
+                url=tile_url,
+                zIndex=100,
+                opacity=1,
+            )
+        )
+        tile_layers.append(dl.Overlay(dl.LayerGroup(layers), name=collection_id, checked=True))
+    return tile_layers, min_vals, max_vals
 
 
 # Callback function that will update the output container based on input
@@ -81,21 +188,233 @@ def register_callbacks(app: dash.Dash):
         Input("interval", "n_intervals")
     )
 
+    # Identify this page load, so superseded leadtime commits can be dropped server-side
+    app.clientside_callback(
+        """
+        function(_) {
+            return window.crypto.randomUUID();
+        }
+        """,
+        Output("session-id", "data"),
+        Input("page-load-trigger", "data"),
+    )
+
+    # While dragging, only the label is updated (clientside)
+    app.clientside_callback(
+        """
+        function(leadtime, selectedDate) {
+            if (!selectedDate || leadtime === null || leadtime === undefined) {
+                return window.dash_clientside.no_update;
+            }
+            const date = new Date(selectedDate + "T00:00:00Z");
+            date.setUTCDate(date.getUTCDate() + leadtime);
+            return "Selected Leadtime: " + date.toISOString().slice(0, 10);
+        }
+        """,
+        Output("selected-time", "children"),
+        Input("leadtime-slider", "value"),
+        Input("forecast-init-date-picker", "value"),
+    )
+
+    # Layer work is committed once the slider is released or has paused.
+    # Each commit carries an increasing sequence number for this page load.
+    app.clientside_callback(
+        """
+        function(leadtime, sessionId) {
+            const state = window.leadtimeCommit = window.leadtimeCommit || {seq: 0, timer: null};
+            clearTimeout(state.timer);
+            state.timer = setTimeout(function() {
+                state.seq += 1;
+                window.dash_clientside.set_props(
+                    "leadtime-committed",
+                    {data: {leadtime: leadtime, seq: state.seq, session: sessionId}}
+                );
+            }, %d);
+            return window.dash_clientside.no_update;
+        }
+        """ % LEADTIME_COMMIT_DELAY_MS,
+        Output("leadtime-committed", "data"),
+        Input("leadtime-slider", "value"),
+        State("session-id", "data"),
+    )
+
+    # Server callbacks follow the viewport once the map has stopped moving, like leadtime commits
+    app.clientside_callback(
+        """
+        function(bounds) {
+            const state = window.viewportCommit = window.viewportCommit || {timer: null};
+            clearTimeout(state.timer);
+            state.timer = setTimeout(function() {
+                window.dash_clientside.set_props("viewport-committed", {data: bounds});
+            }, %d);
+            return window.dash_clientside.no_update;
+        }
+        """ % LEADTIME_COMMIT_DELAY_MS,
+        Output("viewport-committed", "data"),
+        Input("map", "bounds"),
+    )
+
+    # Hide a layer's preview once its full resolution tiles have loaded
+    app.clientside_callback(
+        """
+        function(nLoads) {
+            return nLoads ? 0 : window.dash_clientside.no_update;
+        }
+        """,
+        Output({"type": "cog-preview", "index": MATCH}, "opacity"),
+        Input({"type": "cog-collections", "index": MATCH}, "n_loads"),
+        prevent_initial_call=True,
+    )
+
+    # Show or hide the comparison pane, both maps change size
+    app.clientside_callback(
+        """
+        function(compareMode, style) {
+            const split = (compareMode || []).includes("split");
+            const now = Date.now();
+            return [Object.assign({}, style, {display: split ? "block" : "none"}), now, now];
+        }
+        """,
+        Output("compare-pane", "style"),
+        Output("map", "invalidateSize"),
+        Output("compare-map", "invalidateSize"),
+        Input("compare-mode", "value"),
+        State("compare-pane", "style"),
+        prevent_initial_call=True,
+    )
+
+    # Keep the panes' pan and zoom linked, moving whichever pane did not trigger
+    app.clientside_callback(
+        """
+        function(center, zoom, compareCenter, compareZoom, compareMode) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!(compareMode || []).includes("split") || !center || !compareCenter) {
+                return [noUpdate, noUpdate];
+            }
+            const latLng = c => Array.isArray(c) ? c : [c.lat, c.lng];
+            const [lat, lng] = latLng(center);
+            const [compareLat, compareLng] = latLng(compareCenter);
+            // Stop once both panes show the same view, moving a map triggers this again
+            if (zoom === compareZoom && Math.abs(lat - compareLat) < 1e-6 && Math.abs(lng - compareLng) < 1e-6) {
+                return [noUpdate, noUpdate];
+            }
+            const triggered = window.dash_clientside.callback_context.triggered.map(t => t.prop_id);
+            if (triggered.some(id => id.startsWith("compare-map."))) {
+                return [{center: [compareLat, compareLng], zoom: compareZoom, transition: "setView"}, noUpdate];
+            }
+            return [noUpdate, {center: [lat, lng], zoom: zoom, transition: "setView"}];
+        }
+        """,
+        Output("map", "viewport"),
+        Output("compare-map", "viewport"),
+        Input("map", "center"),
+        Input("map", "zoom"),
+        Input("compare-map", "center"),
+        Input("compare-map", "zoom"),
+        Input("compare-mode", "value"),
+        prevent_initial_call=True,
+    )
+
+    # The comparison pane picks from the same collections and variables
+    app.clientside_callback(
+        """
+        function(collectionOptions, variableOptions) {
+            return [collectionOptions, variableOptions];
+        }
+        """,
+        Output("compare-collection-dropdown", "options"),
+        Output("compare-variable-dropdown", "options"),
+        Input("collections-dropdown", "options"),
+        Input("variable-dropdown", "options"),
+    )
+
     @app.callback(
-        [
-            Output("collections-dropdown", "options"),
-        ],
-        [Input("page-load-trigger", "data")],
+        Output("collections-store", "data"),
+        Input("page-load-trigger", "data"),
+        background=True,
         prevent_initial_callback=True,
     )
     def update_collections(_):
-        stac = STAC(STAC_FASTAPI_URL)
-        collections = stac.get_catalog_collection_ids(resolve=True)
-        options = []
-        for collection in collections:
-            option = {"label": collection.id, "value": collection.id}
-            options.append(option)
-        return [options]
+        """
+        Lists the catalog's collections and their spatial extents. Runs as a
+        background job since large catalogs are paged through in full.
+        """
+        apply_pending()
+
+        def _list_collections() -> dict[str, list[float]]:
+            stac = open_catalog(STAC_FASTAPI_URL, deadline=Deadline(BACKGROUND_JOB_TIMEOUT))
+            return stac.get_collection_bboxes()
+
+        return shared_job(("collections", STAC_FASTAPI_URL), _list_collections)
+
+    @app.callback(
+        Output("collections-dropdown", "options"),
+        Input("collections-store", "data"),
+        Input("viewport-committed", "data"),
+        State("collections-dropdown", "value"),
+        prevent_initial_call=True,
+    )
+    def filter_collections(collection_bboxes: dict, bounds: list, selected: list):
+        """
+        Offers only the collections whose spatial extent intersects the map viewport,
+        once the map stops moving. Collections that are already selected stay listed
+        so the selection is kept.
+        """
+        if not collection_bboxes:
+            return []
+        for collection_id, bbox in collection_bboxes.items():
+            if collection_index.get(collection_id) != tuple(bbox):
+                collection_index.insert(collection_id, bbox)
+        visible = collection_index.query(leaflet_bounds_to_bbox(bounds))
+        visible.update(selected or [])
+        return [
+            {"label": collection_id, "value": collection_id}
+            for collection_id in collection_bboxes
+            if collection_id in visible
+        ]
+
+    def discover_forecast_dates(collection_ids: list, set_progress) -> tuple[set, dict]:
+        """
+        Walks the selected collections for their forecast reference times and leadtimes.
+
+        Args:
+            collection_ids: Collections to walk.
+            set_progress: Background callback progress setter, called with
+                `(percent, label)` as each collection is walked.
+
+        Returns:
+            The set of forecast start datetimes, and a dict mapping each
+            'YYYY-MM-DD' start date to the ISO date its leadtime ends on.
+        """
+        deadline = Deadline(BACKGROUND_JOB_TIMEOUT)
+        stac = open_catalog(STAC_FASTAPI_URL, deadline=deadline)
+        all_forecast_dates = set()
+        forecast_dates_dict = {}
+
+        for collection_idx, collection_id in enumerate(collection_ids):
+            if deadline.expired:
+                logging.warning(f"Time budget exhausted, skipping forecast dates for {collection_id}")
+                break
+            set_progress(
+                (round(100 * collection_idx / len(collection_ids)), f"Loading {collection_id}")
+            )
+            try:
+                summaries = collection_item_summaries(stac, collection_id)
+
+                for summary in summaries:
+                    d = summary.reference_time
+                    all_forecast_dates.add(d)
+                    # Use the latest leadtime per date from all collections
+                    if summary.leadtime is None:
+                        logging.warning(f"Leadtime missing for {collection_id} on {d}")
+                    else:
+                        leadtime_end = (d + timedelta(days=summary.leadtime)).date().isoformat()
+                        forecast_dates_dict[d.strftime("%Y-%m-%d")] = leadtime_end
+
+            except Exception as e:
+                logging.error(f"Failed to retrieve forecast dates for {collection_id}: {e}")
+
+        return all_forecast_dates, forecast_dates_dict
 
     @app.callback(
         [
@@ -110,16 +429,29 @@ def register_callbacks(app: dash.Dash):
             Input("page-load-trigger", "data"),
             Input("collections-dropdown", "value"),
         ],
+        background=True,
+        progress=[
+            Output("discovery-progress", "value"),
+            Output("discovery-progress", "label"),
+        ],
+        running=[
+            (Output("discovery-progress", "style"), {"display": "flex"}, {"display": "none"}),
+        ],
         prevent_initial_callback=True,
     )
     def update_forecast_start_dates(
-        _, collection_ids: list
+        set_progress, _, collection_ids: list
     ) -> list[list[str], str | None, str | None, str | None, pd.DatetimeIndex | None]:
         """
         This function retrieves and processes forecast start dates from the STAC Catalog.
         It returns a list containing sorted forecast start dates, min/max allowed dates,
         initial visible month, and disabled days for the date picker.
 
+        Runs as a background job reporting progress to 'discovery-progress'. Changing
+        the collection selection re-triggers the callback, and Dash cancels the
+        superseded job. Identical selections made at the same time by other users
+        share the result of one walk.
+
         Returns:
             A list containing:
                 - Sorted forecast start dates
@@ -131,32 +463,11 @@ def register_callbacks(app: dash.Dash):
         if not collection_ids:
             return [None, None, None, None, None, None]
 
-        stac = STAC(STAC_FASTAPI_URL)
-        all_forecast_dates = set()
-        forecast_dates_dict = {}
-
-        for collection_id in collection_ids:
-            try:
-                forecast_init_dates = stac.get_collection_forecast_init_dates(collection_id)
-
-                if not forecast_init_dates:
-                    continue
-
-                for d in forecast_init_dates:
-                    all_forecast_dates.add(d)
-                    # Use the latest leadtime per date from all collections
-                    try:
-                        leadtime = stac.get_item_leadtime(
-                            collection_id, forecast_reference_time=datetime_to_str(d)
-                        )
-                        leadtime_end = (d + timedelta(days=leadtime)).date().isoformat()
-                        forecast_dates_dict[d.strftime("%Y-%m-%d")] = leadtime_end
-                    except Exception as lt_err:
-                        logging.warning(f"Leadtime error for {collection_id} on {d}: {lt_err}")
-
-            except Exception as e:
-                logging.error(f"Failed to retrieve forecast dates for {collection_id}: {e}")
-
+        apply_pending()
+        all_forecast_dates, forecast_dates_dict = shared_job(
+            ("forecast_dates", STAC_FASTAPI_URL, tuple(sorted(collection_ids)), catalog_generation()),
+            lambda: discover_forecast_dates(collection_ids, set_progress),
+        )
 
         if not all_forecast_dates:
             logging.debug("No forecast dates loaded from any selected collection.")
@@ -192,42 +503,48 @@ def register_callbacks(app: dash.Dash):
     @app.callback(
         Output("variable-dropdown", "options"),
         Input("forecast-init-date-picker", "value"),
-        Input("leadtime-slider", "value"),
+        Input("leadtime-committed", "data"),
         Input("collections-dropdown", "value"),
+        Input("viewport-committed", "data"),
         prevent_initial_call=True,
     )
-    def update_available_variables(selected_date, leadtime: int, collection_ids: list):
+    def update_available_variables(selected_date, leadtime_commit: dict, collection_ids: list, bounds: list):
         """
         Updates the variable dropdown based on selected date, leadtime, and multiple collection IDs.
-        Aggregates variable options from all selected collections.
+        Aggregates variable options from all selected collections visible in the map viewport,
+        recomputed once the map stops moving. Dropped if a newer leadtime has been committed
+        by the same session.
         """
         if not selected_date or not collection_ids:
             return []
 
-        stac = STAC(STAC_FASTAPI_URL)
+        supersede.claim(leadtime_commit, "update_available_variables")
+
+        bbox = leaflet_bounds_to_bbox(bounds)
+        collection_ids = visible_collections(collection_ids, bbox)
+        deadline = Deadline(CALLBACK_TIME_BUDGET)
+        stac = open_catalog(STAC_FASTAPI_URL, deadline=deadline, bbox=bbox)
 
         # Convert to ISO 8601 format which is what the "forecast:reference_time" property is stored as
         forecast_reference_time_str = datetime.strptime(selected_date, "%Y-%m-%d").isoformat() + "Z"
 
         combined_vars = {}
 
-        for collection_id in collection_ids:
-            try:
-                available_vars = stac.get_asset_bands(
-                    collection_id,
-                    forecast_reference_time_str,
-                    forecast_reference_time_str,
-                )
-
-                if available_vars:
-                    for var_name, band_index in available_vars.items():
-                        # Avoid collisions: only keep first occurrence
-                        if var_name not in combined_vars:
-                            combined_vars[var_name] = band_index
+        supersede.check(leadtime_commit, "update_available_variables")
+        try:
+            summaries = stac.get_item_summaries(collection_ids, forecast_reference_time_str)
+        except DeadlineExceeded:
+            logging.warning("Time budget exhausted before variables were retrieved")
+            summaries = {}
 
-            except Exception as e:
-                logging.warning(f"Error retrieving variables for {collection_id}: {e}")
+        for collection_id, summary in summaries.items():
+            if isinstance(summary, Exception):
+                logging.warning(f"Error retrieving variables for {collection_id}: {summary}")
                 continue
+            for var_name, band_index in summary.band_map.items():
+                # Avoid collisions: only keep first occurrence
+                if var_name not in combined_vars:
+                    combined_vars[var_name] = band_index
 
         if not combined_vars:
             return []
@@ -237,13 +554,11 @@ def register_callbacks(app: dash.Dash):
 
     @app.callback(
         Output("time-slider-div", "style"),
-        Output("selected-time", "children"),
         Output("leadtime-slider", "min"),
         Output("leadtime-slider", "max"),
         Output("leadtime-slider", "marks"),
         Input("window-width", "data"),
         Input("forecast-init-date-picker", "value"),
-        Input("leadtime-slider", "value"),
         State("forecast-dates-store", "data"),
         State("time-slider-div", "style"),
         prevent_initial_call=True,
@@ -251,11 +566,13 @@ def register_callbacks(app: dash.Dash):
     def update_leadtime_slider(
         window_width: str,
         selected_date: str,
-        leadtime: int,
         forecast_dates: dict,
         slider_style,
     ):
         """
+        Shows the slider and sets its range and marks for the selected forecast.
+        The 'Selected Leadtime' label is updated clientside while dragging.
+
         selected_date: String format of 'YYYY-MM-DD'
         forecast_dates: Dict with keys in 'YYYY-MM-DD', and values in format of '%Y-%m-%dT%H-%M'
         """
@@ -293,17 +610,18 @@ def register_callbacks(app: dash.Dash):
             for idx in leadtimes[::step]
         ]
 
-        current_label = (forecast_start_date + timedelta(days=leadtime)).strftime("%Y-%m-%d")
-        current_leadtime = f"Selected Leadtime: {current_label}"
-
         slider_style["display"] = "inline-block"
-        return slider_style, current_leadtime, leadtime_min, leadtime_max, marks
+        return slider_style, leadtime_min, leadtime_max, marks
 
 
     @app.callback(
         Output("cog-results-layer", "children"),
         Output("fixed-min", "value"),
         Output("fixed-max", "value"),
+        Output("compare-results-layer", "children"),
+        Output("compare-cbar", "min"),
+        Output("compare-cbar", "max"),
+        Output("compare-cbar", "colorscale"),
         Input("colormap-dropdown", "value"),
         Input("forecast-init-date-picker", "value"),
         Input("variable-dropdown", "value"),
@@ -311,7 +629,12 @@ def register_callbacks(app: dash.Dash):
         Input("fixed-min", "value"),
         Input("fixed-max", "value"),
         Input("collections-dropdown", "value"),
-        Input("leadtime-slider", "value"),
+        Input("layer-mode", "value"),
+        Input("compare-mode", "value"),
+        Input("compare-collection-dropdown", "value"),
+        Input("compare-variable-dropdown", "value"),
+        Input("leadtime-committed", "data"),
+        Input("viewport-committed", "data"),
         prevent_initial_call=True,
     )
     def update_cog_layer(
@@ -322,86 +645,177 @@ def register_callbacks(app: dash.Dash):
         fixed_min,
         fixed_max,
         collection_ids: list,
-        leadtime: int = 0,
+        layer_mode: str,
+        compare_mode: list | None,
+        compare_collection: str | None,
+        compare_band_index: int | None,
+        leadtime_commit: dict | None = None,
+        bounds: list | None = None,
     ):
         """
         Updates the COG layers on the map based on selected colormap, date, and leadtime.
+        The items and band statistics of all collections are fetched concurrently.
+
+        In split-map mode the second pane shows another variable and/or collection.
+        Both panes are built from one item lookup and one statistics lookup over
+        the collections and bands of either pane.
 
         Args:
             colormap: The selected colormap.
             forecast_start_date: The selected initial date for the forecast.
                 If not provided, no tiles will be displayed.
-            leadtime (optional): The lead time in days. Defaults to 0.
+            layer_mode: 'forecast', or 'anomaly' to show the forecast minus its
+                collection's climatology.
+            compare_mode: Contains 'split' if the comparison pane is shown.
+            compare_collection: Collection of the comparison pane, `None` for the
+                collections of the main pane.
+            compare_band_index: Variable of the comparison pane, `None` for the main variable.
+            leadtime_commit (optional): The committed leadtime slider value, with the
+                sequence number and session used to drop superseded requests.
+                Defaults to leadtime 0.
+            bounds (optional): Map viewport, committed once the map stops moving.
+                Collections and items outside it are skipped, and are rendered once
+                panned or zoomed into view.
 
         Returns:
-            list: A list of Overlay objects representing the COG layers with updated tile URLs and options.
+            The main pane's Overlay layers and rescale range, then the comparison
+            pane's layers, rescale range and colorscale. If the time budget runs out,
+            only the collections that finished in time are returned.
         """
-
+        unchanged = (no_update,) * 7
         if not forecast_start_date:
-            return no_update, no_update, no_update
-
-        stac = STAC(STAC_FASTAPI_URL)
+            return unchanged
+
+        supersede.claim(leadtime_commit, "update_cog_layer")
+        leadtime = supersede.committed_leadtime(leadtime_commit)
+        bbox = leaflet_bounds_to_bbox(bounds)
+        collection_ids = visible_collections(collection_ids or [], bbox)
+        compare = "split" in (compare_mode or [])
+        compare_ids = []
+        if compare:
+            compare_ids = visible_collections([compare_collection], bbox) if compare_collection else collection_ids
+            compare_band_index = compare_band_index or band_index
+        deadline = Deadline(CALLBACK_TIME_BUDGET)
+        stac = open_catalog(STAC_FASTAPI_URL, deadline=deadline, bbox=bbox)
 
         # Convert to ISO 8601 format expected
         forecast_reference_time_str = datetime.strptime(forecast_start_date, "%Y-%m-%d").isoformat() + "Z"
-        tile_layers = []
-        min_vals = []
-        max_vals = []
-
-        for idx, collection_id in enumerate(collection_ids):
-            try:
-                # Get COG assets for this collection and date
-                cogs = stac.get_item_cogs(collection_id, forecast_reference_time_str)
-                cog_assets = list(cogs.values())
-
-                if leadtime >= len(cog_assets):
-                    logging.warning(f"Leadtime {leadtime} out of range for {collection_id}")
-                    continue
-
-                cog_asset = cog_assets[leadtime]
-                cog_href = cog_asset.href
-
-                # Determine rescale range
-                if "fixed" in (fix_range or []):
-                    min_val = fixed_min if fixed_min is not None else 0
-                    max_val = fixed_max if fixed_max is not None else 1
-                else:
-                    # Get min/max to rescale the 0-255 image to data range
-                    band_stats = get_cog_band_statistics(TILER_URL, cog_url=cog_href, band_index=band_index)
-                    min_val = band_stats.get("min", 0)
-                    max_val = band_stats.get("max", 1)
-
-                min_val, max_val = round_2dp(min_val), round_2dp(max_val)
-                min_vals.append(min_val)
-                max_vals.append(max_val)
-
-                tile_url = get_tile_url(cog_href) + f"&colormap_name={colormap}&rescale={min_val},{max_val}&bidx={band_index}"
-
-                print("tile_url:", tile_url)
-
-                layer = dl.Overlay(
-                    dl.TileLayer(
-                        id={"type": "cog-collections", "index": 0},
-                        url=tile_url,
-                        zIndex=100,
-                        opacity=1,
-                    ),
-                    name=collection_id,
-                    checked=True,
-                )
-                tile_layers.append(layer)
 
+        # Get COG assets for every collection of either pane on this date, concurrently
+        manifest_ids = list(dict.fromkeys(collection_ids + compare_ids))
+        supersede.check(leadtime_commit, "update_cog_layer")
+        try:
+            summaries = stac.get_item_summaries(manifest_ids, forecast_reference_time_str)
+        except DeadlineExceeded:
+            logging.warning("Time budget exhausted before any layer was found")
+            return unchanged
+
+        cog_hrefs = {}
+        for collection_id in manifest_ids:
+            summary = summaries[collection_id]
             # Handle exception where this collection does not have the selected date
-            except Exception as e:
-                logging.error(f"Error processing collection {collection_id}: {e}")
-                continue
-
-        if not tile_layers:
-            return no_update, no_update, no_update
+            if isinstance(summary, Exception):
+                logging.error(f"Error processing collection {collection_id}: {summary}")
+            elif leadtime >= len(summary.asset_hrefs):
+                logging.warning(f"Leadtime {leadtime} out of range for {collection_id}")
+            else:
+                cog_hrefs[collection_id] = summary.asset_hrefs[leadtime]
+
+        # The fixed range applies to the comparison pane too if it shows the same variable
+        fixed = "fixed" in (fix_range or [])
+        fixed_range = (
+            fixed_min if fixed_min is not None else 0,
+            fixed_max if fixed_max is not None else 1,
+        ) if fixed else None
+        panes = [("main", collection_ids, band_index, fixed_range)]
+        if compare:
+            panes.append(
+                ("compare", compare_ids, compare_band_index, fixed_range if compare_band_index == band_index else None)
+            )
+
+        # Get min/max to rescale the 0-255 image to data range, for both panes at once
+        wanted = {
+            (cog_hrefs[collection_id], pane_band)
+            for _, pane_ids, pane_band, pane_range in panes
+            if pane_range is None
+            for collection_id in pane_ids
+            if collection_id in cog_hrefs
+        }
+        band_stats = {}
+        if wanted:
+            supersede.check(leadtime_commit, "update_cog_layer")
+            try:
+                band_stats = get_cog_band_statistics_many(TILER_URL, sorted(wanted), deadline=deadline)
+            except DeadlineExceeded:
+                logging.warning("Time budget exhausted before statistics were fetched")
+                return unchanged
+
+        results = [
+            build_pane_layers(
+                pane, pane_ids, summaries, cog_hrefs, band_stats, pane_band, pane_range, colormap, layer_mode, leadtime
+            )
+            for pane, pane_ids, pane_band, pane_range in panes
+        ]
+        tile_layers, min_vals, max_vals = results[0]
+        if not tile_layers and not (compare and results[1][0]):
+            return unchanged
 
         # Use first min/max, or optionally min(min_vals)/max(max_vals) for all layers
-        return tile_layers, min(min_vals), max(max_vals)
+        main_outputs = (tile_layers, min(min_vals), max(max_vals)) if tile_layers else (no_update,) * 3
+        if not compare:
+            return *main_outputs, [], no_update, no_update, no_update
+        compare_layers, compare_mins, compare_maxs = results[1]
+        if not compare_layers:
+            return *main_outputs, [], no_update, no_update, no_update
+        return (
+            *main_outputs,
+            compare_layers,
+            min(compare_mins),
+            max(compare_maxs),
+            convert_colormap_to_colorscale(colormap),
+        )
+
+    @app.callback(
+        Output("export-links", "children"),
+        Input("forecast-init-date-picker", "value"),
+        Input("variable-dropdown", "value"),
+        Input("collections-dropdown", "value"),
+        Input("leadtime-committed", "data"),
+        Input("export-leadtimes", "value"),
+        Input("export-format", "value"),
+        Input("viewport-committed", "data"),
+    )
+    def update_export_links(
+        forecast_start_date: str,
+        band_index: int,
+        collection_ids: list,
+        leadtime_commit: dict | None,
+        export_leadtimes: str,
+        export_format: str,
+        bounds: list | None,
+    ):
+        """
+        Download links exporting the selected variable over the current view,
+        updated once the map stops moving.
 
+        The links point at the streaming export route, so the data never passes
+        through a callback.
+        """
+        if not forecast_start_date or not collection_ids:
+            return []
+        bbox = leaflet_bounds_to_bbox(bounds)
+        forecast_reference_time_str = datetime.strptime(forecast_start_date, "%Y-%m-%d").isoformat() + "Z"
+        leadtime = None if export_leadtimes == "all" else supersede.committed_leadtime(leadtime_commit)
+        return [
+            html.A(
+                f"Download {collection_id}",
+                href=get_export_url(
+                    collection_id, forecast_reference_time_str, band_index, bbox, leadtime, export_format
+                ),
+                download="",
+            )
+            for collection_id in visible_collections(collection_ids, bbox)
+        ]
 
     @app.callback(
         Output("cbar", "colorscale"),
@@ -0,0 +1,136 @@
+"""
+Low resolution previews of map layers.
+
+A preview is one small Web Mercator PNG of a COG band over the item bbox, with the
+layer's colormap and rescale. At this size titiler reads the COG's coarsest
+overview, so the map can show a usable first paint from one request while the
+full resolution tiles stream in on top of it.
+
+Previews are cached in the shared disk cache, tagged with their COG URL so the
+catalog invalidation hook can evict those of replaced COGs.
+"""
+import logging
+import math
+from urllib.parse import urlencode
+
+import flask
+import requests
+from config import PREVIEW_SIZE, STATISTICS_CACHE_TTL, TILER_URL, UPSTREAM_TIMEOUT
+from stac.singleflight import SingleFlight
+
+from .background import cache
+from .utils import tiler_breaker
+from .warming import MAX_LATITUDE
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_ROUTE = "/previews/cog.png"
+
+_previews = SingleFlight("tiler.preview")
+
+
+def preview_bounds(bbox) -> list[list[float]]:
+    """
+    Leaflet `[[south, west], [north, east]]` bounds of the preview of an item bbox.
+    """
+    west, south, east, north = list(bbox)[:4]
+    return [
+        [max(-MAX_LATITUDE, south), west],
+        [min(MAX_LATITUDE, north), east],
+    ]
+
+
+def _mercator_y(lat: float) -> float:
+    return math.asinh(math.tan(math.radians(lat))) / (2 * math.pi)
+
+
+def _preview_shape(bbox, max_size: int) -> tuple[int, int]:
+    """
+    Width and height in pixels of a preview, keeping the Web Mercator aspect ratio.
+    """
+    (south, west), (north, east) = preview_bounds(bbox)
+    width = (east - west) / 360.0
+    height = _mercator_y(north) - _mercator_y(south)
+    scale = max_size / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def get_preview_url(cog_path: str, colormap: str, band_index: int, min_val: float, max_val: float, bbox) -> str:
+    """
+    Dashboard URL of the preview of a layer, see `get_layer_tile_url`.
+    """
+    (south, west), (north, east) = preview_bounds(bbox)
+    return PREVIEW_ROUTE + "?" + urlencode({
+        "url": cog_path,
+        "bidx": band_index,
+        "colormap_name": colormap,
+        "rescale": f"{min_val},{max_val}",
+        "bbox": f"{west},{south},{east},{north}",
+    })
+
+
+def get_preview(cog_url: str, band_index: int, colormap: str, rescale: str, bbox: str) -> bytes:
+    """
+    PNG preview of a COG band, rendered by titiler once and then served from the cache.
+
+    Args:
+        cog_url: URL of the COG.
+        band_index: 1-based index of the band.
+        colormap: rio-tiler colormap name.
+        rescale: `min,max` rescale range.
+        bbox: `west,south,east,north` in degrees.
+    """
+    key = ("preview", cog_url, band_index, colormap, rescale, bbox)
+    png = cache.get(key)
+    if png is not None:
+        return png
+
+    def _render() -> bytes:
+        bounds = [float(v) for v in bbox.split(",")]
+        width, height = _preview_shape(bounds, PREVIEW_SIZE)
+        r = requests.get(
+            f"{TILER_URL}/cog/bbox/{bbox}/{width}x{height}.png",
+            params={
+                "url": cog_url,
+                "bidx": band_index,
+                "colormap_name": colormap,
+                "rescale": rescale,
+                "dst_crs": "epsg:3857",
+            },
+            timeout=UPSTREAM_TIMEOUT,
+        )
+        r.raise_for_status()
+        cache.set(key, r.content, expire=STATISTICS_CACHE_TTL, tag=cog_url)
+        return r.content
+
+    return _previews.do(key, tiler_breaker.call, _render, wait_timeout=UPSTREAM_TIMEOUT)
+
+
+def evict_previews(cog_urls: set[str]) -> None:
+    """
+    Drop the cached previews of COGs that were replaced upstream.
+    """
+    for cog_url in cog_urls:
+        cache.evict(cog_url)
+
+
+def register_routes(server: flask.Flask) -> None:
+    """
+    Serve layer previews at `PREVIEW_ROUTE`.
+    """
+
+    @server.route(PREVIEW_ROUTE)
+    def cog_preview():
+        args = flask.request.args
+        try:
+            png = get_preview(
+                args["url"], int(args["bidx"]), args["colormap_name"], args["rescale"], args["bbox"]
+            )
+        except (KeyError, ValueError):
+            flask.abort(400)
+        except Exception as e:
+            logger.warning(f"Preview of {args.get('url')} failed: {e}")
+            flask.abort(502)
+        response = flask.Response(png, mimetype="image/png")
+        response.headers["Cache-Control"] = f"public, max-age={int(STATISTICS_CACHE_TTL)}"
+        return response
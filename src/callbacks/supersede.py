@@ -0,0 +1,61 @@
+import logging
+
+import metrics
+from config import LEADTIME_COMMIT_TTL
+from dash.exceptions import PreventUpdate
+
+from .background import cache
+
+logger = logging.getLogger(__name__)
+
+
+def committed_leadtime(commit: dict | None) -> int:
+    """
+    Leadtime index from the 'leadtime-committed' store, 0 before the first commit.
+    """
+    return int((commit or {}).get("leadtime") or 0)
+
+
+def _key(commit: dict) -> tuple:
+    return ("leadtime-seq", commit["session"])
+
+
+def claim(commit: dict | None, callback_name: str) -> None:
+    """
+    Record `commit` as the latest leadtime commit seen for its session.
+
+    The latest sequence number per session is kept in the shared disk cache, so a
+    commit handled by any gunicorn worker on the host supersedes older ones.
+
+    Args:
+        commit: Value of the 'leadtime-committed' store, with `leadtime`, `seq`
+            and `session` keys.
+        callback_name: Name used in logs and the `callbacks.superseded` counter.
+
+    Raises:
+        PreventUpdate: If a newer commit from the same session has already arrived.
+    """
+    if not commit or not commit.get("session"):
+        return
+    with cache.transact():
+        latest = cache.get(_key(commit), default=0)
+        if commit["seq"] > latest:
+            cache.set(_key(commit), commit["seq"], expire=LEADTIME_COMMIT_TTL)
+    check(commit, callback_name)
+
+
+def check(commit: dict | None, callback_name: str) -> None:
+    """
+    Drop the current callback if its leadtime commit has been superseded.
+
+    Call before each upstream request so superseded work stops early.
+
+    Raises:
+        PreventUpdate: If a newer commit from the same session exists.
+    """
+    if not commit or not commit.get("session"):
+        return
+    if cache.get(_key(commit), default=0) > commit["seq"]:
+        metrics.increment(f"callbacks.superseded.{callback_name}")
+        logger.debug(f"{callback_name}: dropping superseded leadtime {commit['leadtime']}")
+        raise PreventUpdate
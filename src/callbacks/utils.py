@@ -1,12 +1,59 @@
+import functools
 import math
-import requests
+from config import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    STATISTICS_CACHE_TTL,
+    TILER_URL,
+    UPSTREAM_TIMEOUT,
+)
 from rio_tiler.colormap import ColorMaps
+from stac import aio
+from stac.cache import TTLCache
+from stac.resilience import CircuitBreaker, Deadline
+from stac.snapshot import get_snapshot
+
+# Fails fast for all tiler calls while titiler is unhealthy.
+tiler_breaker = CircuitBreaker("tiler", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+# Band statistics keyed by (titiler URL, COG URL, band index).
+statistics_cache = TTLCache("tiler.statistics", STATISTICS_CACHE_TTL)
 
 
 def round_2dp(value):
     return math.floor(value * 100) / 100
 
 
+# Function to generate tile URL for a STAC Item
+def get_tile_url(cog_path: str):
+    """
+    Returns the tile URL for the given STAC Item (i.e. COG path).
+
+    Args:
+        cog_path: The path to the Cloud Optimized GeoTIFF file relative to `DATA_URL`.
+
+    Returns:
+        The URL using the specified tiler and format, with placeholders for z, x, y.
+
+    Raises:
+        None
+    """
+    return f"{TILER_URL}/cog/tiles/WebMercatorQuad/{{z}}/{{x}}/{{y}}?url={cog_path}"
+    # To return tiles back in EPSG:6931
+    # Useful when Leaflet reprojection code is working.
+    # return f"{TILER_URL}/cog/tiles/EPSG6931/{{z}}/{{x}}/{{y}}?url={cog_path}"
+
+
+def get_layer_tile_url(cog_path: str, colormap: str, band_index: int, min_val: float, max_val: float) -> str:
+    """
+    Tile URL template of a map layer showing one band of a COG.
+
+    Layers and the tile warming job build their URLs here, so warmed tiles are the
+    ones the browser asks for.
+    """
+    return get_tile_url(cog_path) + f"&colormap_name={colormap}&rescale={min_val},{max_val}&bidx={band_index}"
+
+
+@functools.cache
 def convert_colormap_to_colorscale(cmap: str):
     """
     Convert a rio_tiler colormap to colorscale format.
@@ -14,6 +61,7 @@ def convert_colormap_to_colorscale(cmap: str):
     This function uses the `ColorMaps` utility to get the RGB and alpha values for each
     color in the specified colormap, then formats them as strings suitable for use with
     Dash-leaflet [Colorbar](https://www.dash-leaflet.com/components/controls/colorbar).
+    Results are cached, the returned list must not be modified.
 
     Args:
         cmap: The name of the rio_tiler colormap to convert.
@@ -38,15 +86,96 @@ def convert_colormap_to_colorscale(cmap: str):
     return colorscale
 
 
-def get_cog_band_statistics(TITILER_URL: str, cog_url: str, band_index: int) -> dict:
-    stats_url = f"{TITILER_URL}/cog/statistics"
-    r = requests.get(stats_url, params={"url": cog_url, "bidx": band_index})
-    r.raise_for_status()
-    stats = r.json()
+def get_cog_band_statistics(
+    TITILER_URL: str, cog_url: str, band_index: int, deadline: Deadline | None = None
+) -> dict:
+    """
+    Get titiler statistics for a single band of a COG.
+
+    Statistics stored in the catalog snapshot, if one is in use, or cached by an
+    earlier call are returned without a request. Otherwise the request goes through
+    the async upstream path, where identical requests made concurrently from any
+    callback are coalesced into one upstream call.
 
-    # Use the first key in the stats dictionary,
-    # this should match the band returned.
-    first_band_key = next(iter(stats))
-    band_stats = stats[first_band_key]
+    Args:
+        TITILER_URL: Base URL of the titiler service.
+        cog_url: URL of the COG to compute statistics for.
+        band_index: 1-based index of the band.
+        deadline: Time budget of the calling callback, the request timeout is
+            capped at the remaining budget.
+
+    Returns:
+        The statistics dict for the requested band (`min`, `max`, `mean`, ...).
 
+    Raises:
+        DeadlineExceeded: If the budget ran out before the statistics were fetched.
+        CircuitOpenError: If titiler is currently marked unhealthy.
+    """
+    band_stats = get_cog_band_statistics_many(TITILER_URL, [(cog_url, band_index)], deadline=deadline)[
+        (cog_url, band_index)
+    ]
+    if isinstance(band_stats, Exception):
+        raise band_stats
     return band_stats
+
+
+def get_cog_band_statistics_many(
+    TITILER_URL: str, bands: list[tuple[str, int]], deadline: Deadline | None = None
+) -> dict[tuple[str, int], "dict | Exception"]:
+    """
+    `get_cog_band_statistics` for several `(cog_url, band_index)` pairs at once.
+
+    Statistics not in the snapshot or cache are fetched concurrently on the async
+    upstream path, each request bounded by the remaining time budget.
+
+    Returns:
+        A dict mapping each pair to its statistics, or to the exception raised
+        while fetching them.
+    """
+    snapshot = get_snapshot()
+    results = {}
+    missing = []
+    for cog_url, band_index in dict.fromkeys(bands):
+        band_stats = snapshot.get_statistics(cog_url, band_index) if snapshot is not None else None
+        if band_stats is None:
+            band_stats = statistics_cache.get((TITILER_URL, cog_url, band_index))
+        if band_stats is None:
+            missing.append((cog_url, band_index))
+        else:
+            results[(cog_url, band_index)] = band_stats
+    if not missing:
+        return results
+
+    timeout = (deadline or Deadline(None)).timeout(UPSTREAM_TIMEOUT)
+
+    # Concurrent requests for the same COG band statistics share one tiler call
+    def _fetch(cog_url: str, band_index: int):
+        return aio.coalesce(
+            "tiler.statistics",
+            (TITILER_URL, cog_url, band_index),
+            lambda: tiler_breaker.acall(aio.cog_statistics, TITILER_URL, cog_url, band_index, timeout),
+        )
+
+    fetched = aio.gather([_fetch(*band) for band in missing], timeout=timeout)
+    for band, band_stats in zip(missing, fetched):
+        if not isinstance(band_stats, Exception):
+            statistics_cache.set((TITILER_URL, *band), band_stats)
+        results[band] = band_stats
+    return results
+
+
+def invalidate_statistics(cog_urls: set[str]) -> None:
+    """
+    Forget cached statistics of COGs that were replaced upstream.
+    """
+    statistics_cache.pop_where(lambda key, _: key[1] in cog_urls)
+
+
+def get_cog_rescale(
+    TITILER_URL: str, cog_url: str, band_index: int, deadline: Deadline | None = None
+) -> tuple[float, float]:
+    """
+    Default `(min, max)` rescale range of a COG band, from its titiler statistics.
+    """
+    band_stats = get_cog_band_statistics(TITILER_URL, cog_url=cog_url, band_index=band_index, deadline=deadline)
+    return round_2dp(band_stats.get("min", 0)), round_2dp(band_stats.get("max", 1))
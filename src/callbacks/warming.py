@@ -0,0 +1,189 @@
+"""
+Tile cache warming for newly published forecasts.
+
+Requests the low-zoom tiles of every leadtime of an item, with the default
+colormap and rescale `update_cog_layer` would use, so the first users to open a
+new forecast get tiles from the tile cache instead of waiting for titiler to
+render them cold.
+
+Jobs are started by the catalog invalidation hook for each added or replaced
+reference time, or by hand (from `src/`):
+
+    python -m callbacks.warming north_daily_forecast 2024-01-01T00:00:00Z
+"""
+import argparse
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+import diskcache
+import metrics
+import requests
+from config import (
+    DEFAULT_BAND_INDEX,
+    DEFAULT_COLORMAP,
+    STAC_FASTAPI_URL,
+    TILE_WARM_MAX_ZOOM,
+    TILE_WARM_RATE,
+    TILER_URL,
+    UPSTREAM_TIMEOUT,
+)
+from stac.process import open_catalog
+from stac.resilience import CircuitOpenError
+
+from .background import cache
+from .utils import get_cog_rescale, get_layer_tile_url, tiler_breaker
+
+logger = logging.getLogger(__name__)
+
+# Web Mercator stops short of the poles
+MAX_LATITUDE = 85.0511287798
+
+# One warming job at a time per worker, plus a host-wide lock in `warm_item`
+_jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tile-warming")
+
+
+def _tile_x(lon: float, zoom: int) -> int:
+    return min(2**zoom - 1, max(0, int((lon + 180.0) / 360.0 * 2**zoom)))
+
+
+def _tile_y(lat: float, zoom: int) -> int:
+    lat = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+    y = (1.0 - math.asinh(math.tan(lat)) / math.pi) / 2.0 * 2**zoom
+    return min(2**zoom - 1, max(0, int(y)))
+
+
+def tiles_for_bbox(bbox: Iterable[float], min_zoom: int, max_zoom: int) -> list[tuple[int, int, int]]:
+    """
+    Web Mercator `(z, x, y)` tiles covering a `[west, south, east, north]` bbox.
+    """
+    west, south, east, north = list(bbox)[:4]
+    tiles = []
+    for z in range(min_zoom, max_zoom + 1):
+        # Bboxes crossing the antimeridian wrap around to x = 0
+        x_ranges = (
+            [(_tile_x(west, z), 2**z - 1), (0, _tile_x(east, z))]
+            if west > east
+            else [(_tile_x(west, z), _tile_x(east, z))]
+        )
+        for x0, x1 in x_ranges:
+            for x in range(x0, x1 + 1):
+                for y in range(_tile_y(north, z), _tile_y(south, z) + 1):
+                    tiles.append((z, x, y))
+    return tiles
+
+
+class _RateLimiter:
+    """
+    Spaces calls to `wait()` at least `1 / rate` seconds apart.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self._interval = 1.0 / rate
+        self._next = time.monotonic()
+
+    def wait(self) -> None:
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next) + self._interval
+
+
+def warm_item(
+    collection_id: str,
+    forecast_reference_time: str,
+    colormap: str = DEFAULT_COLORMAP,
+    band_index: int = DEFAULT_BAND_INDEX,
+    max_zoom: int = TILE_WARM_MAX_ZOOM,
+    rate: float = TILE_WARM_RATE,
+) -> int:
+    """
+    Request the tiles from zoom 0 to `max_zoom` over an item's bbox, for every leadtime.
+
+    Only one warming job runs at a time on the host, and its statistics and tile
+    requests are spaced to at most `rate` per second, so interactive traffic keeps
+    priority. The job stops early if titiler is marked unhealthy.
+
+    Args:
+        collection_id: Collection of the item.
+        forecast_reference_time: 'forecast:reference_time' of the item.
+        colormap: Colormap of the warmed tiles.
+        band_index: Band of the warmed tiles.
+        max_zoom: Highest zoom level to warm.
+        rate: Most tiler requests per second.
+
+    Returns:
+        Number of tiles requested.
+    """
+    stac = open_catalog(STAC_FASTAPI_URL)
+    _, bbox = stac.get_item_extents(collection_id, forecast_reference_time)
+    summary = stac.get_item_summary(collection_id, forecast_reference_time)
+    tiles = tiles_for_bbox(bbox or [-180.0, -90.0, 180.0, 90.0], 0, max_zoom)
+    limiter = _RateLimiter(rate)
+    session = requests.Session()
+    warmed = 0
+
+    # `expire` releases the lock if the job dies, allowing twice the expected run time
+    expected_seconds = len(summary.asset_hrefs) * (len(tiles) + 1) / rate
+    with diskcache.Lock(cache, "tile-warming-lock", expire=2 * expected_seconds + 60):
+        logger.info(
+            f"Warming {len(tiles)} tiles x {len(summary.asset_hrefs)} leadtimes "
+            f"of {collection_id} {forecast_reference_time}"
+        )
+        for leadtime, cog_href in enumerate(summary.asset_hrefs):
+            try:
+                limiter.wait()
+                min_val, max_val = get_cog_rescale(TILER_URL, cog_url=cog_href, band_index=band_index)
+                tile_url = get_layer_tile_url(cog_href, colormap, band_index, min_val, max_val)
+                for z, x, y in tiles:
+                    limiter.wait()
+                    response = tiler_breaker.call(
+                        session.get, tile_url.format(z=z, x=x, y=y), timeout=UPSTREAM_TIMEOUT
+                    )
+                    # Empty tiles (e.g. outside the data) are fine, connection errors open the breaker
+                    if response.status_code >= 500:
+                        logger.warning(f"Tile {z}/{x}/{y} of {cog_href} failed: {response.status_code}")
+                    warmed += 1
+                    metrics.increment("tiles.warmed")
+            except CircuitOpenError:
+                logger.warning(f"Tiler unhealthy, stopped warming {collection_id} at leadtime {leadtime}")
+                break
+            except Exception as e:
+                logger.warning(f"Failed warming leadtime {leadtime} of {collection_id}: {e}")
+    logger.info(f"Warmed {warmed} tiles of {collection_id} {forecast_reference_time}")
+    return warmed
+
+
+def _warm_logged(collection_id: str, forecast_reference_time: str) -> None:
+    try:
+        warm_item(collection_id, forecast_reference_time)
+    except Exception as e:
+        logger.error(f"Tile warming of {collection_id} {forecast_reference_time} failed: {e}")
+
+
+def schedule(collection_id: str, forecast_reference_times: list[str]) -> None:
+    """
+    Queue warming jobs for newly published items, in a background thread.
+    """
+    if TILE_WARM_MAX_ZOOM < 0:
+        return
+    for forecast_reference_time in forecast_reference_times:
+        _jobs.submit(_warm_logged, collection_id, forecast_reference_time)
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description="Warm the tile cache for a forecast item.")
+    argparser.add_argument("collection", help="Collection id")
+    argparser.add_argument("reference_time", help="forecast:reference_time of the item, e.g. 2024-01-01T00:00:00Z")
+    argparser.add_argument("--max-zoom", type=int, default=TILE_WARM_MAX_ZOOM, help="Highest zoom level to warm")
+    argparser.add_argument("--rate", type=float, default=TILE_WARM_RATE, help="Most tiler requests per second")
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    warm_item(args.collection, args.reference_time, max_zoom=args.max_zoom, rate=args.rate)
+
+
+if __name__ == "__main__":
+    main()
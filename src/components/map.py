@@ -1,5 +1,7 @@
+import dash_bootstrap_components as dbc
 import dash_leaflet as dl
 import dash_mantine_components as dmc
+from config import DEFAULT_BAND_INDEX, DEFAULT_COLORMAP
 from dash import dcc, html
 from rio_tiler.colormap import ColorMaps
 
@@ -7,7 +9,6 @@ from rio_tiler.colormap import ColorMaps
 DEFAULT_CENTER = [0, 0]
 DEFAULT_ZOOM = 2
 AVAILABLE_COLORMAPS = ColorMaps().list()
-DEFAULT_COLORMAP = "blues_r"
 
 # Blues_r for colourbar which uses different input to titiler's approach to colour:
 blues_r = [
@@ -27,39 +28,80 @@ leaflet_map = html.Div(
     # style={'width': 'inherit', 'height': 'inherit'},
     style={"width": "inherit", "height": "inherit", "position": "relative"},
     children=[
-        dl.Map(
+        # Main map, and the comparison pane of split-map mode next to it
+        html.Div(
             [
-                dl.TileLayer(
-                    id="map-base-layer",
-                    attribution=("© OpenStreetMap contributors"),
-                    zIndex=0,
+                dl.Map(
+                    [
+                        dl.TileLayer(
+                            id="map-base-layer",
+                            attribution=("© OpenStreetMap contributors"),
+                            zIndex=0,
+                        ),
+                        dl.LayersControl([], id="cog-results-layer"),
+                        dl.Colorbar(
+                            id="cbar",
+                            width=30,
+                            height=200,
+                            style={"opacity": "1.0",
+                                "backgroundColor": "rgba(255, 255, 255, 0.8)",
+                                "padding": "10px",
+                                "border-radius": "10px",
+                                },
+                            position="topleft",
+                            tooltip=True,
+                            colorscale=blues_r,
+                        ),
+                        dl.ScaleControl(position="bottomright"),
+                        dl.FullScreenControl(position="bottomleft"),
+                        dl.EasyButton(icon="ti ti-settings", title="controls", id="controls-btn"),
+                    ],
+                    crs="EPSG3857",
+                    attributionControl=True,
+                    style={"flex": "1 1 0", "height": "100%"},
+                    center=DEFAULT_CENTER,
+                    zoom=DEFAULT_ZOOM,
+                    zoomDelta=0.1,
+                    zoomSnap=0.1,
+                    id="map",
                 ),
-                dl.LayersControl([], id="cog-results-layer"),
-                dl.Colorbar(
-                    id="cbar",
-                    width=30,
-                    height=200,
-                    style={"opacity": "1.0",
-                        "backgroundColor": "rgba(255, 255, 255, 0.8)",
-                        "padding": "10px",
-                        "border-radius": "10px",
-                        },
-                    position="topleft",
-                    tooltip=True,
-                    colorscale=blues_r,
+                html.Div(
+                    dl.Map(
+                        [
+                            dl.TileLayer(
+                                attribution=("© OpenStreetMap contributors"),
+                                zIndex=0,
+                            ),
+                            dl.LayersControl([], id="compare-results-layer"),
+                            dl.Colorbar(
+                                id="compare-cbar",
+                                width=30,
+                                height=200,
+                                style={"opacity": "1.0",
+                                    "backgroundColor": "rgba(255, 255, 255, 0.8)",
+                                    "padding": "10px",
+                                    "border-radius": "10px",
+                                    },
+                                position="topleft",
+                                tooltip=True,
+                                colorscale=blues_r,
+                            ),
+                            dl.ScaleControl(position="bottomright"),
+                        ],
+                        crs="EPSG3857",
+                        attributionControl=True,
+                        style={"width": "100%", "height": "100%"},
+                        center=DEFAULT_CENTER,
+                        zoom=DEFAULT_ZOOM,
+                        zoomDelta=0.1,
+                        zoomSnap=0.1,
+                        id="compare-map",
+                    ),
+                    id="compare-pane",
+                    style={"flex": "1 1 0", "height": "100%", "borderLeft": "2px solid #333", "display": "none"},
                 ),
-                dl.ScaleControl(position="bottomright"),
-                dl.FullScreenControl(position="bottomleft"),
-                dl.EasyButton(icon="ti ti-settings", title="controls", id="controls-btn"),
             ],
-            crs="EPSG3857",
-            attributionControl=True,
-            style={"width": "inherit", "height": "inherit"},
-            center=DEFAULT_CENTER,
-            zoom=DEFAULT_ZOOM,
-            zoomDelta=0.1,
-            zoomSnap=0.1,
-            id="map",
+            style={"display": "flex", "width": "inherit", "height": "inherit"},
         ),
         # Controls for map manipulation
         html.Div(
@@ -79,14 +121,51 @@ leaflet_map = html.Div(
                     placeholder="Select",
                     popoverProps={"zIndex": 10000},
                 ),
+                # Progress of the background forecast date discovery, shown while running
+                dbc.Progress(
+                    id="discovery-progress",
+                    value=0,
+                    label="",
+                    striped=True,
+                    animated=True,
+                    style={"display": "none"},
+                    className="my-1",
+                ),
                 html.Label("Select Variable:"),
                 dcc.Dropdown(
                     id="variable-dropdown",
                     # options=[{"label": var, "value": var} for var in VARIABLES],
                     # value=VARIABLES[0],
-                    value=1,
+                    value=DEFAULT_BAND_INDEX,
                     clearable=False,
                 ),
+                dcc.RadioItems(
+                    id="layer-mode",
+                    options=[
+                        {"label": "Forecast", "value": "forecast"},
+                        {"label": "Anomaly", "value": "anomaly"},
+                    ],
+                    value="forecast",
+                    inline=True,
+                    inputStyle={"marginRight": "4px", "marginLeft": "4px"},
+                ),
+                html.Label("Compare:"),
+                dcc.Checklist(
+                    id="compare-mode",
+                    options=[{"label": "Split map", "value": "split"}],
+                    value=[],
+                    inputStyle={"marginRight": "4px"},
+                ),
+                dcc.Dropdown(
+                    id="compare-collection-dropdown",
+                    options=[],
+                    placeholder="Same collections",
+                ),
+                dcc.Dropdown(
+                    id="compare-variable-dropdown",
+                    options=[],
+                    placeholder="Same variable",
+                ),
                 html.Label("Select Colormap:"),
                 dcc.Dropdown(
                     id="colormap-dropdown",
@@ -146,6 +225,29 @@ leaflet_map = html.Div(
                         },
                     ),
                 ], style={}),
+                html.Label("Export View:", style={"marginTop": "10px"}),
+                dcc.RadioItems(
+                    id="export-leadtimes",
+                    options=[
+                        {"label": "This leadtime", "value": "current"},
+                        {"label": "All leadtimes", "value": "all"},
+                    ],
+                    value="current",
+                    inline=True,
+                    inputStyle={"marginRight": "4px", "marginLeft": "4px"},
+                ),
+                dcc.RadioItems(
+                    id="export-format",
+                    options=[
+                        {"label": "NetCDF", "value": "nc"},
+                        {"label": "CSV", "value": "csv"},
+                    ],
+                    value="nc",
+                    inline=True,
+                    inputStyle={"marginRight": "4px", "marginLeft": "4px"},
+                ),
+                # One download link per selected collection, streamed by the server
+                html.Div(id="export-links", style={"display": "flex", "flexDirection": "column"}),
             ],
             style={
                 "position": "absolute",
@@ -161,6 +263,7 @@ leaflet_map = html.Div(
             },
             id="controls"
         ),
+        dcc.Store(id="collections-store", data=None),
         dcc.Store(id="forecast-dates-store", data=None),
         dcc.Store(id="fix-colorbar-range", data=None),
     ],
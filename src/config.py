@@ -4,6 +4,87 @@ import logging
 # Get config from environmental variables
 STAC_FASTAPI_URL = os.getenv("STAC_FASTAPI_URL", "http://localhost:8000")
 TILER_URL = os.getenv("TILER_URL", "http://localhost:8002")
+# Serve the catalog from an offline snapshot file instead of `STAC_FASTAPI_URL`
+# (see `python -m stac.snapshot export --help`)
+CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT")
+
+# Time budget (seconds) for a single callback, shared by all its upstream calls
+CALLBACK_TIME_BUDGET = float(os.getenv("CALLBACK_TIME_BUDGET", "10"))
+# Upper bound (seconds) on any single STAC or tiler request
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "5"))
+# Consecutive upstream failures before failing fast, and seconds before retrying
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+# Pooled connections per worker for concurrent (async) upstream requests
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+
+# Disk-backed job manager for background callbacks (catalog discovery)
+BACKGROUND_CACHE_DIR = os.getenv("BACKGROUND_CACHE_DIR", "/tmp/stac-dashboard-jobs")
+# Time budget (seconds) for a background job, and how long its lock may be held
+BACKGROUND_JOB_TIMEOUT = float(os.getenv("BACKGROUND_JOB_TIMEOUT", "300"))
+# How long (seconds) a finished job's result is shared with identical jobs
+SHARED_JOB_RESULT_TTL = float(os.getenv("SHARED_JOB_RESULT_TTL", "10"))
+
+# Pause (ms) after the last leadtime slider or map movement before layers are updated
+LEADTIME_COMMIT_DELAY_MS = int(os.getenv("LEADTIME_COMMIT_DELAY_MS", "250"))
+# How long (seconds) the latest leadtime commit of a session is remembered
+LEADTIME_COMMIT_TTL = float(os.getenv("LEADTIME_COMMIT_TTL", "600"))
+
+# Bearer token the catalog invalidation hook requires, the hook is disabled if unset
+INVALIDATION_TOKEN = os.getenv("INVALIDATION_TOKEN")
+# How long (seconds) item summaries, collection date indexes and band statistics
+# are cached. Only pushed changes keep long TTLs fresh, so they default to a day
+# with the invalidation hook configured and to five minutes without it.
+_DEFAULT_CACHE_TTL = "86400" if INVALIDATION_TOKEN else "300"
+ITEM_CACHE_TTL = float(os.getenv("ITEM_CACHE_TTL", _DEFAULT_CACHE_TTL))
+STATISTICS_CACHE_TTL = float(os.getenv("STATISTICS_CACHE_TTL", _DEFAULT_CACHE_TTL))
+# Age (seconds) after which a cached collection date index is revalidated against a
+# fingerprint of the collection, refreshing its TTL while the collection is unchanged
+LISTING_REVALIDATE_INTERVAL = float(os.getenv("LISTING_REVALIDATE_INTERVAL", "300"))
+
+# Colormap and band index shown until the user picks others, also used to warm tiles
+DEFAULT_COLORMAP = os.getenv("DEFAULT_COLORMAP", "blues_r")
+DEFAULT_BAND_INDEX = int(os.getenv("DEFAULT_BAND_INDEX", "1"))
+
+# Highest zoom level warmed for newly published items (-1 disables warming), and
+# the most tiler requests per second a warming job may make
+TILE_WARM_MAX_ZOOM = int(os.getenv("TILE_WARM_MAX_ZOOM", "4"))
+TILE_WARM_RATE = float(os.getenv("TILE_WARM_RATE", "10"))
+
+# Longest side (pixels) of the low resolution layer previews shown before tiles load
+PREVIEW_SIZE = int(os.getenv("PREVIEW_SIZE", "256"))
+
+# Time budget (seconds) for loading the catalog in the gunicorn master before
+# workers are forked (see `gunicorn.conf.py`). No worker serves requests, health
+# checks included, until it has run out, so keep it well below their window.
+WARM_START_TIMEOUT = float(os.getenv("WARM_START_TIMEOUT", "15"))
+
+# Smallest response (bytes) compressed with brotli/gzip
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+# Serve the CDN stylesheets from local copies (see `python -m delivery vendor`)
+VENDOR_STYLESHEETS = os.getenv("VENDOR_STYLESHEETS", "").lower() in ("1", "true", "yes")
+VENDOR_DIR = os.getenv("VENDOR_DIR", os.path.join(os.path.dirname(__file__), "vendor"))
+
+# Bearer token for the on-demand profiler endpoints, which are disabled if unset
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+# Bearer token for the `/metrics` endpoint, which is disabled if unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Where workers write their profiles, and the sampling interval (seconds)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/stac-dashboard-profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+# Most COGs the analysis datacube keeps open per worker, at least the leadtimes of one
+# item (93 for the daily forecasts), and its dask chunk size (pixels)
+DATACUBE_MAX_OPEN = int(os.getenv("DATACUBE_MAX_OPEN", "256"))
+DATACUBE_CHUNK_SIZE = int(os.getenv("DATACUBE_CHUNK_SIZE", "512"))
+
+# Most values (leadtimes x pixels) one data export may stream
+EXPORT_MAX_CELLS = int(os.getenv("EXPORT_MAX_CELLS", "50000000"))
+
+# Where climatologies are stored (keep on a persistent volume), and the longest
+# side (pixels) of their grids
+CLIMATOLOGY_DIR = os.getenv("CLIMATOLOGY_DIR", "/tmp/stac-dashboard-climatology")
+CLIMATOLOGY_SIZE = int(os.getenv("CLIMATOLOGY_SIZE", "256"))
 
 logging.info("TILER URL:", TILER_URL)
 logging.info("STAC_FASTAPI_URL:", STAC_FASTAPI_URL)
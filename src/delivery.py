@@ -0,0 +1,175 @@
+"""
+Compressed and cache-busted delivery of callback payloads and static assets.
+
+- Responses above `COMPRESS_MIN_SIZE` bytes (callback JSON, CSS, JS) are
+  compressed with brotli or gzip, whichever the browser accepts.
+- Files in `src/assets` are requested by Dash with a `?m=<mtime>` fingerprint and
+  are served with immutable cache headers.
+- With `VENDOR_STYLESHEETS` set, the CDN stylesheets are served from local,
+  content-hashed copies under `/vendor/` instead. Download them with (from `src/`):
+
+      python -m delivery vendor
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import re
+from urllib.parse import urljoin, urlparse
+
+import flask
+import requests
+from config import COMPRESS_MIN_SIZE, VENDOR_DIR, VENDOR_STYLESHEETS
+
+logger = logging.getLogger(__name__)
+
+VENDOR_ROUTE = "/vendor"
+IMMUTABLE = "public, max-age=31536000, immutable"
+_MANIFEST = "manifest.json"
+# `url(...)` references inside a stylesheet
+_CSS_URL = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+
+
+def stylesheet_urls(stylesheets: list) -> list:
+    """
+    `stylesheets` with CDN URLs replaced by their vendored copies, if enabled.
+
+    URLs missing from the vendored manifest keep pointing at the CDN.
+    """
+    manifest_path = os.path.join(VENDOR_DIR, _MANIFEST)
+    if not VENDOR_STYLESHEETS:
+        return stylesheets
+    if not os.path.exists(manifest_path):
+        logger.warning(f"VENDOR_STYLESHEETS is set but {manifest_path} is missing, using the CDN")
+        return stylesheets
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    for url in stylesheets:
+        if isinstance(url, str) and url.startswith("http") and url not in manifest:
+            logger.warning(f"{url} is not vendored, using the CDN")
+    return [manifest.get(url, url) if isinstance(url, str) else url for url in stylesheets]
+
+
+def make_server(import_name: str) -> flask.Flask:
+    """
+    Flask server for the Dash app, with the compression settings that
+    `Dash(compress=True)` applies when it sets up flask-compress.
+    """
+    server = flask.Flask(import_name)
+    server.config.update(
+        COMPRESS_ALGORITHM=["br", "gzip"],
+        COMPRESS_MIN_SIZE=COMPRESS_MIN_SIZE,
+        COMPRESS_MIMETYPES=[
+            "application/json",
+            "application/javascript",
+            "text/css",
+            "text/csv",
+            "text/html",
+            "text/javascript",
+            "text/plain",
+        ],
+    )
+    return server
+
+
+def configure(app) -> None:
+    """
+    Enable long-lived caching of static files on the Dash app.
+    """
+    server = app.server
+    assets_prefix = app.config.requests_pathname_prefix.rstrip("/") + "/assets/"
+
+    @server.after_request
+    def _cache_fingerprinted_assets(response: flask.Response) -> flask.Response:
+        if flask.request.path.startswith(assets_prefix) and "m" in flask.request.args:
+            response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+    @server.route(f"{VENDOR_ROUTE}/<path:filename>")
+    def vendored_file(filename: str):
+        """
+        Vendored stylesheets and the fonts/images they use, under content-hashed paths.
+        """
+        response = flask.send_from_directory(os.path.abspath(VENDOR_DIR), filename)
+        response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+
+def _vendor_stylesheet(session: requests.Session, url: str, vendor_dir: str) -> str:
+    """
+    Download a stylesheet and the files it references into a content-hashed directory.
+
+    Returns:
+        The route the vendored stylesheet is served at.
+    """
+    response = session.get(url, timeout=30)
+    response.raise_for_status()
+    css = response.text
+    resources = {}
+
+    def _localise(match: re.Match) -> str:
+        reference = match.group(2).strip()
+        if reference.startswith(("data:", "#")):
+            return match.group(0)
+        parts = urlparse(urljoin(url, reference))
+        resource_url = parts._replace(query="", fragment="").geturl()
+        # Prefixed with a hash of the URL, files of the same name from different places do not collide
+        url_hash = hashlib.sha256(resource_url.encode()).hexdigest()[:8]
+        local = f"files/{url_hash}-{posixpath.basename(parts.path)}"
+        resources[local] = resource_url
+        suffix = (f"?{parts.query}" if parts.query else "") + (f"#{parts.fragment}" if parts.fragment else "")
+        return f"url({local}{suffix})"
+
+    css = _CSS_URL.sub(_localise, css)
+    fingerprint = hashlib.sha256(css.encode()).hexdigest()[:12]
+    directory = os.path.join(vendor_dir, fingerprint)
+    os.makedirs(os.path.join(directory, "files"), exist_ok=True)
+    for local, resource_url in resources.items():
+        resource = session.get(resource_url, timeout=30)
+        resource.raise_for_status()
+        with open(os.path.join(directory, local), "wb") as f:
+            f.write(resource.content)
+
+    name = posixpath.basename(urlparse(url).path) or "stylesheet.css"
+    with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+        f.write(css)
+    logger.info(f"Vendored {url} with {len(resources)} files")
+    return f"{VENDOR_ROUTE}/{fingerprint}/{name}"
+
+
+def vendor_stylesheets(stylesheets: list, vendor_dir: str = VENDOR_DIR) -> dict[str, str]:
+    """
+    Vendor every CDN stylesheet in `stylesheets` and write the manifest.
+
+    Returns:
+        The manifest, mapping each CDN URL to its local route.
+    """
+    session = requests.Session()
+    manifest = {}
+    for url in stylesheets:
+        if isinstance(url, str) and url.startswith(("http://", "https://")):
+            manifest[url] = _vendor_stylesheet(session, url, vendor_dir)
+    with open(os.path.join(vendor_dir, _MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description="Manage vendored static files.")
+    subparsers = argparser.add_subparsers(dest="command", required=True)
+    vendor = subparsers.add_parser("vendor", help="Download the CDN stylesheets for VENDOR_STYLESHEETS")
+    vendor.add_argument("-o", "--output", default=VENDOR_DIR, help="Directory to write to")
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from app import stylesheets
+
+    os.makedirs(args.output, exist_ok=True)
+    manifest = vendor_stylesheets(stylesheets, args.output)
+    logger.info(f"Vendored {len(manifest)} stylesheets to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
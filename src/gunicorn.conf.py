@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for the dashboard, used by the `Dockerfile`.
+
+The app is imported once in the master (`preload_app`), which then loads the
+catalog before forking, so workers share it copy-on-write and start warm. Worker
+count and other settings can still be given on the command line or through
+`GUNICORN_CMD_ARGS`/`WEB_CONCURRENCY`.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('DASHBOARD_PORT', '8005')}"
+preload_app = True
+
+
+def when_ready(server):
+    import warmup
+
+    warmup.warm_start()
+
+
+def post_fork(server, worker):
+    import warmup
+
+    warmup.after_fork()
+
+
+def post_worker_init(worker):
+    import profiling
+
+    profiling.install_signal_handler()
@@ -22,6 +22,11 @@ layout = dmc.MantineProvider(
             dcc.Interval(id="interval", interval=10000, n_intervals=0), # Check if width needs updating every 10s.
             html.Div(id="output"),
             dcc.Store(id="page-load-trigger", data=True),
+            dcc.Store(id="session-id"),
+            # Leadtime the server renders, set clientside once the slider settles
+            dcc.Store(id="leadtime-committed"),
+            # Map bounds layers are rendered for, set clientside once the map stops moving
+            dcc.Store(id="viewport-committed"),
             dbc.Row(dbc.Col(header.header_layout, width=12)),
             dbc.Row(
                 [
@@ -56,6 +61,9 @@ layout = dmc.MantineProvider(
                                                 max=1, # Stub
                                                 step=1,
                                                 value=0,
+                                                # Label follows the drag clientside,
+                                                # layers follow 'leadtime-committed'
+                                                updatemode="drag",
                                                 # marks=[
                                                 #     {"value": i, "label": f"{i}h"}
                                                 #     for i in range(0, 24, 3)
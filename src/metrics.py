@@ -0,0 +1,43 @@
+import threading
+
+# In-process counters and gauges. Each gunicorn worker keeps its own copy,
+# exposed as JSON via the `/metrics` route registered in `app.py` (which requires
+# the `METRICS_TOKEN` bearer token).
+_lock = threading.Lock()
+_counters: dict[str, int] = {}
+_gauges: dict[str, float] = {}
+
+
+def increment(name: str, value: int = 1) -> None:
+    """
+    Increment the named counter, creating it if needed.
+
+    Args:
+        name: Dotted counter name, e.g. `stac.search.coalesced`.
+        value: Amount to add to the counter.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    """
+    Set the named gauge to `value`.
+
+    Args:
+        name: Dotted gauge name.
+        value: Current value of the gauge.
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def snapshot() -> dict:
+    """
+    Return a copy of all counters and gauges in this process.
+
+    Returns:
+        A dict with `counters` and `gauges` keys.
+    """
+    with _lock:
+        return {"counters": dict(_counters), "gauges": dict(_gauges)}
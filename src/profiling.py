@@ -0,0 +1,206 @@
+"""
+On-demand sampling profiler for live workers.
+
+Profiling is started per worker process, either through the guarded endpoint
+
+    curl -X POST "$DASHBOARD/debug/profile?callbacks=20&seconds=60" \
+        -H "Authorization: Bearer $PROFILING_TOKEN"
+
+(which starts it in the worker handling the request) or by sending `SIGUSR2` to a
+worker process (not the gunicorn master, which uses it to upgrade). It stops after
+the given number of callback invocations or seconds, whichever comes first.
+
+While it runs, a sampler thread records the stack of every thread busy in a Dash
+callback, rooted at the callback's name. Each worker writes its samples to
+`PROFILE_DIR` in the folded stack format read by flamegraph.pl, speedscope and
+inferno, and `GET /debug/profile` downloads the merged profile of all workers.
+
+Background callbacks run their jobs in separate processes, so only the requests
+starting and polling them are sampled.
+
+When profiling is off, the only cost is one flag check per callback request.
+"""
+import glob
+import hmac
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+import flask
+from config import PROFILE_DIR, PROFILE_INTERVAL, PROFILING_TOKEN
+
+logger = logging.getLogger(__name__)
+
+_enabled = False
+# Reentrant since the signal handler may interrupt a thread holding it
+_lock = threading.RLock()
+# Callback name of each thread currently running a callback, by thread id
+_running: dict[int, str] = {}
+_samples: Counter = Counter()
+_remaining_calls = 0
+_stop_at = 0.0
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample() -> None:
+    frames = sys._current_frames()
+    stacks = []
+    for thread_id, callback_name in list(_running.items()):
+        frame = frames.get(thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        stacks.append(";".join([callback_name, *reversed(stack)]))
+    # Walk the frames unlocked, but count under the lock that snapshots and resets take
+    with _lock:
+        _samples.update(stacks)
+
+
+def _sampler() -> None:
+    while _enabled:
+        if time.monotonic() >= _stop_at:
+            stop()
+            break
+        _sample()
+        time.sleep(PROFILE_INTERVAL)
+
+
+def start(callbacks: int = 20, seconds: float = 60.0) -> bool:
+    """
+    Start profiling the next `callbacks` callback invocations, for at most `seconds`.
+
+    Returns:
+        False if profiling was already running in this worker.
+    """
+    global _enabled, _remaining_calls, _stop_at
+    with _lock:
+        if _enabled:
+            return False
+        _samples.clear()
+        _remaining_calls = callbacks
+        _stop_at = time.monotonic() + seconds
+        _enabled = True
+    threading.Thread(target=_sampler, name="profiler", daemon=True).start()
+    logger.warning(f"Profiling the next {callbacks} callbacks or {seconds}s in worker {os.getpid()}")
+    return True
+
+
+def stop() -> None:
+    """
+    Stop profiling and write this worker's samples to `PROFILE_DIR`.
+    """
+    global _enabled
+    with _lock:
+        if not _enabled:
+            return
+        _enabled = False
+        _running.clear()
+        samples = dict(_samples)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"worker-{os.getpid()}.folded")
+    with open(f"{path}.tmp", "w") as f:
+        f.writelines(f"{stack} {count}\n" for stack, count in samples.items())
+    os.replace(f"{path}.tmp", path)
+    logger.warning(f"Wrote {sum(samples.values())} profile samples to {path}")
+
+
+def merged_profile() -> str:
+    """
+    The folded stacks written by every worker, with counts of identical stacks summed.
+    """
+    merged = Counter()
+    for path in glob.glob(os.path.join(PROFILE_DIR, "worker-*.folded")):
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                merged[stack] += int(count)
+    return "".join(f"{stack} {count}\n" for stack, count in merged.most_common())
+
+
+def _callback_name(app, payload: dict) -> str:
+    callback = app.callback_map.get(payload.get("output"), {}).get("callback")
+    return getattr(callback, "__name__", payload.get("output", "unknown"))
+
+
+def register_routes(app) -> None:
+    """
+    Add the profiling endpoints, request hooks and `SIGUSR2` handler.
+
+    Args:
+        app: The Dash app, whose callback map names the profiled callbacks.
+    """
+    server = app.server
+
+    @server.before_request
+    def _profile_callback():
+        if not _enabled or not flask.request.path.endswith("/_dash-update-component"):
+            return
+        payload = flask.request.get_json(silent=True) or {}
+        _running[threading.get_ident()] = _callback_name(app, payload)
+
+    @server.teardown_request
+    def _end_profiled_callback(_):
+        global _remaining_calls
+        if not _enabled or _running.pop(threading.get_ident(), None) is None:
+            return
+        with _lock:
+            _remaining_calls -= 1
+            finished = _remaining_calls <= 0
+        if finished:
+            stop()
+
+    def _authorised() -> bool:
+        if not PROFILING_TOKEN:
+            flask.abort(404)
+        authorization = flask.request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {PROFILING_TOKEN}".encode()):
+            flask.abort(401)
+        return True
+
+    @server.route("/debug/profile", methods=["POST"])
+    def start_profile():
+        """
+        Profile the next `callbacks` callbacks or `seconds` seconds in this worker.
+        """
+        _authorised()
+        callbacks = flask.request.args.get("callbacks", 20, type=int)
+        seconds = flask.request.args.get("seconds", 60.0, type=float)
+        started = start(callbacks, seconds)
+        return flask.jsonify(worker=os.getpid(), started=started), 202 if started else 409
+
+    @server.route("/debug/profile", methods=["GET"])
+    def download_profile():
+        """
+        Folded stacks of all workers, e.g. for `flamegraph.pl profile.folded > profile.svg`.
+        """
+        _authorised()
+        return flask.Response(
+            merged_profile(),
+            mimetype="text/plain",
+            headers={"Content-Disposition": "attachment; filename=profile.folded"},
+        )
+
+    install_signal_handler()
+
+
+def install_signal_handler() -> None:
+    """
+    Start profiling on `SIGUSR2`.
+
+    Gunicorn resets worker signal handlers after forking, so with `preload_app`
+    this is called again from the `post_worker_init` hook.
+    """
+    try:
+        signal.signal(signal.SIGUSR2, lambda *_: start())
+    except ValueError:
+        # Not in the main thread, e.g. under the Dash dev server reloader
+        logger.debug("Profiling signal handler not installed")
@@ -0,0 +1,216 @@
+"""
+Asyncio HTTP path for upstream STAC and titiler calls.
+
+Each process runs one event loop in a daemon thread, with one pooled
+`httpx.AsyncClient` (HTTP/2 if the `h2` package is installed). Synchronous
+callbacks hand coroutines to it with `run()` or `gather()`, so a callback can
+have dozens of upstream requests in flight without a thread for each.
+
+The loop and client are created on first use in each process, so a gunicorn
+worker forked from a preloaded master never reuses the master's sockets.
+
+Example:
+    >>> stats = aio.gather(
+    ...     [aio.cog_statistics(TILER_URL, href, 1) for href in hrefs], timeout=10
+    ... )
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+import httpx
+import metrics
+from config import UPSTREAM_MAX_CONNECTIONS, UPSTREAM_TIMEOUT
+
+from .resilience import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pid: int | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+_client: httpx.AsyncClient | None = None
+# Requests in flight on this process's loop, by key, for coalescing
+_inflight: dict[Hashable, asyncio.Future] = {}
+
+
+def _make_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_CONNECTIONS // 4,
+        ),
+        timeout=UPSTREAM_TIMEOUT,
+        follow_redirects=True,
+    )
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """
+    This process's upstream event loop, started on first use.
+    """
+    global _pid, _loop, _client
+    if _pid == os.getpid():
+        return _loop
+    with _lock:
+        if _pid != os.getpid():
+            # A forked child inherits neither the loop thread nor usable sockets
+            _loop = asyncio.new_event_loop()
+            _client = None
+            _inflight.clear()
+            threading.Thread(target=_loop.run_forever, name="upstream-loop", daemon=True).start()
+            _pid = os.getpid()
+    return _loop
+
+
+def reset() -> None:
+    """
+    Forget the loop and client inherited from a parent process.
+
+    They are recreated on next use. For gunicorn's `post_fork`, so a worker never
+    touches the master's loop thread or sockets even before its first request.
+    """
+    global _pid, _loop, _client
+    with _lock:
+        _pid, _loop, _client = None, None, None
+        _inflight.clear()
+
+
+def client() -> httpx.AsyncClient:
+    """
+    The pooled client of this process, only to be used on its event loop.
+    """
+    global _client
+    if _client is None:
+        _client = _make_client()
+    return _client
+
+
+def run(coro: Awaitable, timeout: float | None = None) -> Any:
+    """
+    Run a coroutine on the upstream loop and wait for its result.
+
+    Raises:
+        TimeoutError: If it did not finish within `timeout` seconds (it is cancelled).
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _event_loop())
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+
+
+def gather(coros: Iterable[Awaitable], timeout: float | None = None) -> list[Any]:
+    """
+    Run coroutines concurrently on the upstream loop.
+
+    The timeout applies to each coroutine, so those that finish in time are kept
+    when others do not. httpx timeouts bound each connect or read rather than the
+    whole request, and a call coalesced onto another caller's request waits on
+    that caller's budget, so either can outlast the timeout.
+
+    Returns:
+        Their results in order, with the exception in place of each that failed,
+        `DeadlineExceeded` for each that did not finish within `timeout` seconds.
+    """
+    async def _bounded(coro: Awaitable) -> Any:
+        try:
+            return await asyncio.wait_for(coro, timeout)
+        except TimeoutError:
+            raise DeadlineExceeded(f"Upstream call did not finish within {timeout:.1f}s") from None
+
+    async def _gather() -> list[Any]:
+        return await asyncio.gather(*(_bounded(coro) for coro in coros), return_exceptions=True)
+
+    # Only a stuck loop can outlast the per-coroutine timeouts
+    return run(_gather(), timeout and timeout + 1)
+
+
+async def coalesce(name: str, key: Hashable, fn: Callable[[], Awaitable]) -> Any:
+    """
+    Await `fn()`, sharing one in-flight call between identical concurrent requests.
+
+    The async counterpart of `SingleFlight.do`, publishing `<name>.executed` and
+    `<name>.coalesced`. Synchronous callers reach the same in-flight calls with
+    `run()`, so an upstream call is shared whichever path makes it.
+    """
+    key = (name, key)
+    future = _inflight.get(key)
+    if future is not None:
+        metrics.increment(f"{name}.coalesced")
+        return await asyncio.shield(future)
+
+    metrics.increment(f"{name}.executed")
+    future = asyncio.ensure_future(fn())
+    _inflight[key] = future
+    try:
+        return await asyncio.shield(future)
+    finally:
+        if future.done():
+            _inflight.pop(key, None)
+        else:
+            future.add_done_callback(lambda _: _inflight.pop(key, None))
+
+
+async def get_json(url: str, params: dict | None = None, timeout: float | None = None) -> Any:
+    response = await client().get(url, params=params, timeout=timeout or UPSTREAM_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+async def search_items(
+    search_url: str, body: dict, max_items: int | None = None, timeout: float | None = None
+) -> list[dict]:
+    """
+    POST an item search and follow its 'next' links.
+
+    Args:
+        search_url: The STAC API `/search` endpoint.
+        body: Search parameters, e.g. `collections`, `bbox`, `query`, `limit`.
+        max_items: Stop after this many items.
+        timeout: Timeout of each page request.
+
+    Returns:
+        The matching items as raw dicts.
+    """
+    items = []
+    method, url, page_body, params = "POST", search_url, {k: v for k, v in body.items() if v is not None}, None
+    while url:
+        if method == "POST":
+            response = await client().post(url, json=page_body, timeout=timeout or UPSTREAM_TIMEOUT)
+        else:
+            response = await client().get(url, params=params, timeout=timeout or UPSTREAM_TIMEOUT)
+        response.raise_for_status()
+        page = response.json()
+        items.extend(page.get("features", []))
+        if max_items is not None and len(items) >= max_items:
+            return items[:max_items]
+
+        next_link = next((link for link in page.get("links", []) if link.get("rel") == "next"), None)
+        if next_link is None or not page.get("features"):
+            break
+        url = next_link["href"]
+        method = next_link.get("method", "GET").upper()
+        if method == "POST":
+            page_body = {**page_body, **next_link["body"]} if next_link.get("merge") else next_link.get("body", page_body)
+        params = None
+    return items
+
+
+async def cog_statistics(
+    tiler_url: str, cog_url: str, band_index: int, timeout: float | None = None
+) -> dict:
+    """
+    titiler statistics of one band of a COG, like `callbacks.utils.get_cog_band_statistics`.
+    """
+    stats = await get_json(
+        f"{tiler_url}/cog/statistics", params={"url": cog_url, "bidx": band_index}, timeout=timeout
+    )
+    # The first key matches the requested band
+    return stats[next(iter(stats))]
+
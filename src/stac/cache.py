@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import metrics
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe in-process cache with a time-to-live and an LRU size bound.
+
+    Entries can also be dropped explicitly (`pop`, `pop_where`), which is how
+    pushed invalidations keep long TTLs from serving stale catalog data.
+
+    Hits and misses are published through `metrics` as `<name>.hit` and
+    `<name>.miss`.
+
+    Args:
+        name: Name used in metrics, e.g. `stac.items`.
+        ttl: Seconds an entry stays valid.
+        maxsize: Most entries kept, least recently used are evicted first.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = 4096) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                metrics.increment(f"{self.name}.miss")
+                return default
+            self._entries.move_to_end(key)
+        metrics.increment(f"{self.name}.hit")
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Cached value of `key`, calling `fn()` and caching its result on a miss.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = fn()
+            self.set(key, value)
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def pop_where(self, predicate: Callable[[Hashable, Any], bool]) -> list[Any]:
+        """
+        Drop every entry for which `predicate(key, value)` is true.
+
+        Returns:
+            The dropped values.
+        """
+        with self._lock:
+            keys = [key for key, (_, value) in self._entries.items() if predicate(key, value)]
+            return [self._entries.pop(key)[1] for key in keys]
+
+    def items(self) -> list[tuple[Hashable, Any]]:
+        """
+        Snapshot of the unexpired entries.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires, value) in self._entries.items() if expires >= now]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
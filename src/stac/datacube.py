@@ -0,0 +1,131 @@
+"""
+Analysis datacube of a forecast item.
+
+Opens the COG data assets of an item (the same assets `STAC.get_item_cogs`
+returns, in leadtime order) as one lazily loaded `(leadtime, band, y, x)`
+`xarray.DataArray`, chunked with dask along the COG blocks. Nothing is read
+until values are computed, and then only the blocks that are needed.
+
+Opened COGs are kept in a bounded LRU, as is xarray's pool of open file handles,
+so data exports over the same item share one set of open files and GDAL's cache
+of decoded blocks instead of reopening and decoding each COG per request. Both
+LRUs hold at least one full item by default. Concurrent opens of the same COG
+are coalesced, and opens of different COGs run in parallel.
+
+Example:
+    >>> cube = item_cube(stac, "north_daily_forecast", "2024-01-01T00:00:00Z")
+    >>> cube.sel(band=1).isel(leadtime=0).mean().compute()
+"""
+import logging
+import os
+
+import pandas as pd
+import rioxarray
+import xarray as xr
+from config import DATACUBE_CHUNK_SIZE, DATACUBE_MAX_OPEN, ITEM_CACHE_TTL
+from dask.utils import SerializableLock
+
+from .cache import TTLCache
+from .singleflight import SingleFlight
+from .summary import ItemSummary
+
+logger = logging.getLogger(__name__)
+
+# Read remote COGs with as few requests as possible, without listing their directories
+for _option, _value in {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "VSI_CACHE": "TRUE",
+}.items():
+    os.environ.setdefault(_option, _value)
+
+# Least recently used file handles are closed, and transparently reopened on next use
+xr.set_options(file_cache_maxsize=DATACUBE_MAX_OPEN)
+
+# Lazily opened COGs, keyed by (href, overview level)
+_datasets = TTLCache("datacube.open", ITEM_CACHE_TTL, maxsize=DATACUBE_MAX_OPEN)
+# Opens in progress, so a COG requested by several callbacks at once is opened once
+_opens = SingleFlight("datacube.open")
+
+
+def open_cog(href: str, overview_level: int | None = None) -> xr.DataArray:
+    """
+    A COG as a lazy, chunked `(band, y, x)` array, with nodata masked as NaN.
+
+    Args:
+        href: URL or path of the COG.
+        overview_level: 0-based overview to read, `None` for full resolution.
+    """
+    key = (href, overview_level)
+
+    def _open() -> xr.DataArray:
+        # Another caller may have finished opening it since the first lookup
+        array = _datasets.get(key)
+        if array is None:
+            open_kwargs = {} if overview_level is None else {"overview_level": overview_level}
+            array = rioxarray.open_rasterio(
+                href,
+                chunks={"band": 1, "y": DATACUBE_CHUNK_SIZE, "x": DATACUBE_CHUNK_SIZE},
+                masked=True,
+                # One lock per file, so different COGs are read in parallel
+                lock=SerializableLock(),
+                **open_kwargs,
+            )
+            _datasets.set(key, array)
+        return array
+
+    array = _datasets.get(key)
+    return array if array is not None else _opens.do(key, _open)
+
+
+def open_cube(hrefs: tuple[str, ...] | list[str], overview_level: int | None = None) -> xr.DataArray:
+    """
+    COGs of consecutive leadtimes as one lazy `(leadtime, band, y, x)` array.
+
+    Args:
+        hrefs: COG hrefs in leadtime order, e.g. `ItemSummary.asset_hrefs`.
+        overview_level: 0-based overview to read, `None` for full resolution.
+    """
+    if not hrefs:
+        raise ValueError("Cannot build a datacube without COGs")
+    arrays = [open_cog(href, overview_level) for href in hrefs]
+    # The leadtimes of an item share one grid, so skip aligning their coordinates
+    return xr.concat(
+        arrays,
+        dim=pd.Index(range(len(arrays)), name="leadtime"),
+        join="override",
+        combine_attrs="drop_conflicts",
+    )
+
+
+def item_cube(
+    stac, collection_id: str, forecast_reference_time: str, overview_level: int | None = None
+) -> xr.DataArray:
+    """
+    Datacube of every leadtime of an item.
+
+    Args:
+        stac: Catalog returned by `open_catalog`.
+        collection_id: Collection of the item.
+        forecast_reference_time: 'forecast:reference_time' of the item.
+        overview_level: 0-based overview to read, `None` for full resolution.
+    """
+    summary: ItemSummary = stac.get_item_summary(collection_id, forecast_reference_time)
+    return open_cube(summary.asset_hrefs, overview_level)
+
+
+def close_all() -> None:
+    """
+    Close every open dataset, e.g. the file handles a forked worker inherited.
+    """
+    for dataset in _datasets.pop_where(lambda key, _: True):
+        dataset.close()
+
+
+def evict(hrefs: set[str]) -> None:
+    """
+    Drop the open datasets of COGs that were replaced upstream.
+    """
+    for dataset in _datasets.pop_where(lambda key, _: key[0] in hrefs):
+        dataset.close()
@@ -8,30 +8,114 @@ from pystac_client import Client, ItemSearch
 from pystac_client.stac_api_io import StacApiIO
 from urllib3 import Retry
 
+from config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, ITEM_CACHE_TTL, UPSTREAM_TIMEOUT
+
+from . import aio, revalidate
+from .cache import TTLCache
+from .resilience import CircuitBreaker, Deadline
+from .singleflight import SingleFlight
+from .snapshot import SnapshotCatalog, get_snapshot
+from .spatial import BBox, SpatialIndex, bbox_intersects, search_bbox
+from .summary import ItemSummary
+
 logger = logging.getLogger(__name__)
 
+# Shared by every `STAC` instance in this process so that concurrent callbacks
+# making the same pystac-client call share one upstream request. Item searches on
+# the async path are coalesced by `aio.coalesce` under `stac.search` instead.
+_searches = SingleFlight("stac.client")
+# Fails fast for every `STAC` instance while the STAC API is unhealthy.
+breaker = CircuitBreaker("stac", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+# Bboxes of items fetched so far, keyed by (collection id, reference time), so
+# items known to be outside the viewport are not searched for again.
+item_index = SpatialIndex()
+# Item summaries fetched so far, keyed by (STAC URL, collection id, reference time).
+# Entries live for `ITEM_CACHE_TTL`, pushed invalidations drop them sooner.
+item_cache = TTLCache("stac.items", ITEM_CACHE_TTL)
+
+
+def invalidate_items(collection_id: str, reference_times: list[dt] | None = None) -> set[str]:
+    """
+    Forget the cached items of a collection that were added or replaced upstream.
+
+    Args:
+        collection_id: Collection the items belong to.
+        reference_times: Reference times of the changed items, `None` for every
+            item of the collection.
+
+    Returns:
+        Asset hrefs of the dropped items, so statistics of those COGs can be
+        dropped too.
+    """
+    def _matches(key: tuple) -> bool:
+        return key[-2] == collection_id and (reference_times is None or key[-1] in reference_times)
+
+    dropped = item_cache.pop_where(lambda key, _: _matches(key))
+    for key in item_index.query(None):
+        if _matches(key):
+            item_index.remove(key)
+    return {href for summary in dropped for href in summary.asset_hrefs}
+
 
 class STAC:
-    def __init__(self, STAC_FASTAPI_URL: str) -> None:
+    def __init__(
+        self, STAC_FASTAPI_URL: str, deadline: Deadline | None = None, bbox: BBox | None = None
+    ) -> None:
+        """
+        Args:
+            STAC_FASTAPI_URL: Root URL of the STAC API.
+            deadline: Time budget of the calling callback. Every request made through
+                this instance is given at most the remaining budget (capped at
+                `UPSTREAM_TIMEOUT`), and retries are kept short so they fit in it.
+            bbox: Current map viewport as `(west, south, east, north)`. If given,
+                every item search made through this instance is restricted to it.
+        """
         # Refer to pystac-client docs:
         # https://pystac-client.readthedocs.io/en/stable/usage.html
 
-        retry = Retry(
-            total=5, backoff_factor=1, status_forcelist=[502, 503, 504], allowed_methods=None
-        )
-        stac_api_io = StacApiIO(max_retries=retry)
+        self._deadline = deadline or Deadline(None)
+        if deadline is None:
+            retry = Retry(
+                total=5, backoff_factor=1, status_forcelist=[502, 503, 504], allowed_methods=None
+            )
+        else:
+            retry = Retry(
+                total=1, backoff_factor=0.2, status_forcelist=[502, 503, 504], allowed_methods=None
+            )
+        self._stac_io = StacApiIO(max_retries=retry, timeout=UPSTREAM_TIMEOUT)
         self._url = STAC_FASTAPI_URL
-        self._catalog = Client.open(STAC_FASTAPI_URL, stac_io=stac_api_io)
+        self._viewport = bbox
+        self._bbox = search_bbox(bbox)
+        self._catalog = self._upstream(
+            lambda: Client.open(STAC_FASTAPI_URL, stac_io=self._stac_io)
+        )
+
+    def _upstream(self, fn, key: tuple | None = None):
+        """
+        Run an upstream STAC call within the deadline and through the circuit breaker.
+
+        Args:
+            fn: Callable making the request(s).
+            key: If given, identical concurrent calls with this key are coalesced.
+        """
+        self._stac_io.timeout = self._deadline.timeout(UPSTREAM_TIMEOUT)
+        if key is None:
+            return breaker.call(fn)
+        return _searches.do(
+            (self._url, *key), breaker.call, fn, wait_timeout=self._deadline.remaining()
+        )
 
     def _search_collection(self, collection_id) -> ItemSearch:
-        search = self._catalog.search(collections=[collection_id], max_items=None)
+        search = self._catalog.search(
+            collections=[collection_id], bbox=self._bbox, max_items=None
+        )
         return search
 
     def _search_item(
         self, collection_id, item_id, max_items: int | None = None
     ) -> ItemSearch:
         search = self._catalog.search(
-            collections=[collection_id], ids=item_id, max_items=max_items
+            collections=[collection_id], ids=item_id, bbox=self._bbox, max_items=max_items
         )
         return search
 
@@ -42,6 +126,7 @@ class STAC:
         search = self._catalog.search(
             collections=[collection_id],
             query={"forecast:reference_time": {"eq": forecast_reference_time}},
+            bbox=self._bbox,
             max_items=max_items,
         )
         return search
@@ -50,37 +135,235 @@ class STAC:
         self, resolve: bool = False
     ) -> Iterable[Collection] | tuple[Collection]:
         # Get all available collections in STAC API
-        collections = self._catalog.get_all_collections()
-        return tuple(collections) if resolve else collections
+        if not resolve:
+            return self._catalog.get_all_collections()
+        return self._upstream(
+            lambda: tuple(self._catalog.get_all_collections()), key=("collections",)
+        )
+
+    def get_collection_bboxes(self) -> dict[str, list[float]]:
+        """
+        Spatial extent of every collection in the catalog, for the viewport index.
+
+        Returns:
+            A dict mapping collection id to its `[west, south, east, north]` bbox.
+        """
+        def _parse(page: dict) -> tuple[dict[str, list[float]], str | None]:
+            bboxes = {
+                collection["id"]: list(collection["extent"]["spatial"]["bbox"][0])
+                for collection in page.get("collections", [])
+            }
+            next_link = next((link for link in page.get("links", []) if link.get("rel") == "next"), None)
+            return bboxes, next_link["href"] if next_link else None
+
+        def _list() -> dict[str, list[float]]:
+            # Each page is revalidated, unchanged pages are not parsed again
+            bboxes, url, seen = {}, f"{self._url.rstrip('/')}/collections", set()
+            while url and url not in seen:
+                seen.add(url)
+                page_bboxes, url = revalidate.get_revalidated(
+                    self._stac_io.session, url, _parse, timeout=self._deadline.timeout(UPSTREAM_TIMEOUT)
+                )
+                bboxes.update(page_bboxes)
+            return bboxes
+
+        return dict(self._upstream(_list, key=("collection-bboxes",)))
 
     def get_collection_items(self, collection_id, resolve: bool = False):
-        collection = self._catalog.get_collection(collection_id)
-        items = collection.get_items()
+        if self._bbox is None:
+            collection = self._upstream(lambda: self._catalog.get_collection(collection_id))
+            items = collection.get_items()
+        else:
+            items = self._search_collection(collection_id).items()
         return tuple(items) if resolve else items
 
     def get_collection_extents(self, collection_id):
-        collection = self._catalog.get_collection(collection_id)
+        collection = self._upstream(lambda: self._catalog.get_collection(collection_id))
         print(collection)
         temporal_extent = collection.extent.temporal.intervals[0]
         spatial_extent = collection.extent.spatial.bboxes[0]
         return temporal_extent, spatial_extent
 
+    def get_collection_item_summaries(self, collection_id) -> list[ItemSummary]:
+        """
+        Walk a collection's items as compact `ItemSummary` records.
+
+        Items are read from the raw search JSON, so no `pystac.Item` objects are
+        created.
+
+        Returns:
+            The collection's item summaries, sorted by reference time.
+        """
+        def _walk() -> list[ItemSummary]:
+            summaries = []
+            for item in self._search_collection(collection_id).items_as_dicts():
+                # Raises `DeadlineExceeded` rather than paging on past the budget
+                self._stac_io.timeout = self._deadline.timeout(UPSTREAM_TIMEOUT)
+                summary = ItemSummary.from_dict(collection_id, item)
+                if summary.reference_time is not None:
+                    summaries.append(summary)
+            summaries.sort(key=lambda summary: summary.reference_time)
+            return summaries
+
+        return list(self._upstream(_walk, key=("summaries", collection_id, str(self._bbox))))
+
+    def get_collection_fingerprint(self, collection_id) -> tuple | None:
+        """
+        Fingerprint of a collection's items, unchanged unless items were added,
+        removed or the latest replaced. See `revalidate.collection_fingerprint`.
+        """
+        return self._upstream(
+            lambda: revalidate.collection_fingerprint(
+                self._stac_io.session,
+                f"{self._url.rstrip('/')}/search",
+                collection_id,
+                timeout=self._deadline.timeout(UPSTREAM_TIMEOUT),
+            ),
+            key=("fingerprint", collection_id),
+        )
+
     def get_collection_forecast_init_dates(self, collection_id) -> list[dt]:
-        items = self.get_collection_items(collection_id)
-        datetimes = sorted(
-            {item.datetime for item in items if item.datetime is not None}
+        summaries = self.get_collection_item_summaries(collection_id)
+        return sorted({summary.reference_time for summary in summaries})
+
+    def _search_item_dicts(self, collection_id: str, forecast_reference_time: str, timeout: float | None):
+        """
+        Coroutine searching for the raw dicts of the items with a 'forecast:reference_time',
+        at most two (enough to tell that there is more than one).
+
+        Identical concurrent searches share one request on the async upstream path,
+        whether made by `fetch_item_summary` or `get_item_summaries`.
+        """
+        search_url = f"{self._url.rstrip('/')}/search"
+        body = {
+            "collections": [collection_id],
+            "query": {"forecast:reference_time": {"eq": forecast_reference_time}},
+            "bbox": self._bbox,
+            "limit": 2,
+        }
+        return aio.coalesce(
+            "stac.search",
+            (self._url, "item_dict", collection_id, forecast_reference_time, str(self._bbox)),
+            lambda: breaker.acall(aio.search_items, search_url, body, max_items=2, timeout=timeout),
         )
-        return datetimes
+
+    def _check_viewport(self, collection_id: str, forecast_reference_time: str) -> None:
+        """
+        Raise rather than search for an item already known to be outside the viewport.
+        """
+        known_bbox = item_index.get((collection_id, parser.isoparse(forecast_reference_time)))
+        if (
+            self._viewport is not None
+            and known_bbox is not None
+            and not bbox_intersects(known_bbox, self._viewport)
+        ):
+            raise ValueError(f"Item with forecast:reference_time = {forecast_reference_time} in collection {collection_id} is outside the viewport.")
+
+    def fetch_item_summary(self, collection_id: str, forecast_reference_time: str) -> ItemSummary | None:
+        """
+        Search for the `ItemSummary` of an item, bypassing the item cache.
+
+        Returns:
+            The summary, or `None` if no item has this 'forecast:reference_time'.
+        """
+        timeout = self._deadline.timeout(UPSTREAM_TIMEOUT)
+        (items,) = aio.gather([self._search_item_dicts(collection_id, forecast_reference_time, timeout)], timeout)
+        if isinstance(items, Exception):
+            raise items
+
+        if len(items) == 0:
+            return None
+        elif len(items) > 1:
+            raise ValueError(f"Multiple items found with forecast:reference_time = {forecast_reference_time} in collection {collection_id}.")
+
+        summary = ItemSummary.from_dict(collection_id, items[0])
+        if summary.bbox:
+            item_index.insert((collection_id, parser.isoparse(forecast_reference_time)), summary.bbox)
+        return summary
+
+    def get_item_summary(self, collection_id: str, forecast_reference_time: str) -> ItemSummary:
+        """
+        Get the `ItemSummary` of the item with the given 'forecast:reference_time'.
+
+        Summaries are cached per process, and a cached summary is checked against
+        the viewport locally rather than searched for again.
+        """
+        self._check_viewport(collection_id, forecast_reference_time)
+        key = (self._url, collection_id, parser.isoparse(forecast_reference_time))
+        summary = item_cache.get(key)
+        if summary is None:
+            summary = self.fetch_item_summary(collection_id, forecast_reference_time)
+            if summary is None:
+                raise ValueError(f"No item found with forecast:reference_time = {forecast_reference_time} in collection {collection_id}.")
+            item_cache.set(key, summary)
+        return summary
+
+    def get_item_summaries(
+        self, collection_ids: list[str], forecast_reference_time: str
+    ) -> dict[str, "ItemSummary | Exception"]:
+        """
+        `get_item_summary` for several collections at once.
+
+        Summaries that are not cached are searched for concurrently on the async
+        upstream path, each request bounded by the remaining time budget.
+
+        Returns:
+            A dict mapping each collection id to its summary, or to the exception
+            `get_item_summary` would have raised.
+        """
+        reference_time = parser.isoparse(forecast_reference_time)
+        results = {}
+        missing = []
+        for collection_id in collection_ids:
+            try:
+                self._check_viewport(collection_id, forecast_reference_time)
+            except ValueError as e:
+                results[collection_id] = e
+                continue
+            summary = item_cache.get((self._url, collection_id, reference_time))
+            if summary is None:
+                missing.append(collection_id)
+            else:
+                results[collection_id] = summary
+        if not missing:
+            return results
+
+        timeout = self._deadline.timeout(UPSTREAM_TIMEOUT)
+        fetched = aio.gather(
+            [self._search_item_dicts(collection_id, forecast_reference_time, timeout) for collection_id in missing],
+            timeout=timeout,
+        )
+        for collection_id, items in zip(missing, fetched):
+            if isinstance(items, Exception):
+                results[collection_id] = items
+            elif len(items) == 0:
+                results[collection_id] = ValueError(f"No item found with forecast:reference_time = {forecast_reference_time} in collection {collection_id}.")
+            elif len(items) > 1:
+                results[collection_id] = ValueError(f"Multiple items found with forecast:reference_time = {forecast_reference_time} in collection {collection_id}.")
+            else:
+                summary = ItemSummary.from_dict(collection_id, items[0])
+                if summary.bbox:
+                    item_index.insert((collection_id, reference_time), summary.bbox)
+                item_cache.set((self._url, collection_id, reference_time), summary)
+                results[collection_id] = summary
+        return results
 
     def get_item(self, collection_id: str, forecast_reference_time: str) -> Item:
-        search = self._search_item_by_reference_time(collection_id, forecast_reference_time)
-        items = list(search.items())
+        self._check_viewport(collection_id, forecast_reference_time)
+        items = self._upstream(
+            lambda: list(
+                self._search_item_by_reference_time(collection_id, forecast_reference_time).items()
+            ),
+            key=("item", collection_id, forecast_reference_time, str(self._bbox)),
+        )
 
         if len(items) == 0:
             raise ValueError(f"No item found with forecast:reference_time = {forecast_reference_time} in collection {collection_id}.")
         elif len(items) > 1:
             raise ValueError(f"Multiple items found with forecast:reference_time = {forecast_reference_time} in collection {collection_id}.")
 
+        if items[0].bbox:
+            item_index.insert((collection_id, parser.isoparse(forecast_reference_time)), items[0].bbox)
         return items[0]
 
     def get_item_properties(self, collection_id: str, forecast_reference_time: str):
@@ -88,21 +371,13 @@ class STAC:
         return item.properties
 
     def get_item_leadtime(self, collection_id: str, forecast_reference_time: str) -> str:
-        properties = self.get_item_properties(collection_id, forecast_reference_time)
-        return properties["forecast:leadtime_length"]
+        return self.get_item_summary(collection_id, forecast_reference_time).leadtime
 
     def get_item_extents(self, collection_id: str, forecast_reference_time: str):
-        item = self.get_item(collection_id, forecast_reference_time)
-        item_props = item.properties
-        temporal_extent = (
-            item_props["forecast:reference_time"],
-            item_props["forecast:end_time"],
-        )
-        temporal_extent = [
-            parser.isoparse(iso_string) for iso_string in temporal_extent
-        ]
-        # Convert to match datetime like `get_collection_extents`.
-        spatial_extent = item.bbox
+        summary = self.get_item_summary(collection_id, forecast_reference_time)
+        # Datetimes to match `get_collection_extents`.
+        temporal_extent = [summary.reference_time, summary.end_time]
+        spatial_extent = list(summary.bbox) if summary.bbox else None
         return temporal_extent, spatial_extent
 
     def get_item_cogs(self, collection_id: str, forecast_reference_time: str):
@@ -125,3 +400,24 @@ class STAC:
         asset_band_props = self.get_asset_band_props(collection_id, forecast_reference_time, asset_id)
         bands = {band["name"]: band["index"] for band in asset_band_props}
         return bands
+
+    def get_item_bands(self, collection_id: str, forecast_reference_time: str) -> dict[str, int]:
+        return dict(self.get_item_summary(collection_id, forecast_reference_time).band_map)
+
+
+def open_catalog(
+    STAC_FASTAPI_URL: str, deadline: Deadline | None = None, bbox: BBox | None = None
+) -> "STAC | SnapshotCatalog":
+    """
+    Catalog for a callback to read from: the offline snapshot if `CATALOG_SNAPSHOT`
+    is set, otherwise the live STAC API.
+
+    Args:
+        STAC_FASTAPI_URL: Root URL of the STAC API.
+        deadline: Time budget of the calling callback.
+        bbox: Current map viewport as `(west, south, east, north)`.
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return SnapshotCatalog(snapshot, bbox=bbox)
+    return STAC(STAC_FASTAPI_URL, deadline=deadline, bbox=bbox)
@@ -0,0 +1,226 @@
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+import httpx
+import metrics
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a callback's time budget has run out before an upstream call."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream that the circuit breaker marks unhealthy."""
+
+
+# Errors raised when an upstream could not be reached or did not answer in time
+_TRANSPORT_ERRORS = (requests.ConnectionError, requests.Timeout, httpx.TransportError, ConnectionError, TimeoutError)
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    Whether an error means the upstream is unhealthy.
+
+    Only transport errors and 5xx responses count. Client errors such as a 404,
+    and errors parsing a response, say nothing about the upstream's health, nor
+    does a `DeadlineExceeded` raised before it was contacted. Wrapping errors,
+    e.g. pystac_client's `APIError`, are judged by the error they wrap.
+    """
+    while error is not None:
+        if isinstance(error, DeadlineExceeded):
+            return False
+        status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+        if status is not None:
+            return status >= 500
+        if isinstance(error, _TRANSPORT_ERRORS):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class Deadline:
+    """
+    Time budget for a single callback, passed down to every upstream call it makes.
+
+    Args:
+        seconds: Total budget in seconds, or `None` for no deadline.
+
+    Example:
+        >>> deadline = Deadline(10)
+        >>> requests.get(url, timeout=deadline.timeout(5))
+    """
+
+    def __init__(self, seconds: float | None) -> None:
+        self._expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> float | None:
+        """
+        Seconds left in the budget (never negative), or `None` if unbounded.
+        """
+        if self._expires_at is None:
+            return None
+        return max(0.0, self._expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def timeout(self, cap: float | None = None) -> float | None:
+        """
+        Timeout to use for the next upstream call.
+
+        Args:
+            cap: Upper bound on the per-request timeout, e.g. `UPSTREAM_TIMEOUT`.
+
+        Returns:
+            The smaller of `cap` and the remaining budget.
+
+        Raises:
+            DeadlineExceeded: If the budget has already run out.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        if remaining <= 0:
+            raise DeadlineExceeded("Callback time budget exhausted")
+        return remaining if cap is None else min(cap, remaining)
+
+
+class CircuitBreaker:
+    """
+    Fail fast while an upstream service is unhealthy.
+
+    After `failure_threshold` consecutive failures (see `is_upstream_failure`) the
+    breaker opens, and calls are rejected with `CircuitOpenError` without touching
+    the upstream. Once
+    `reset_timeout` seconds have passed a single trial call is let through
+    (half-open): success closes the breaker, failure opens it again.
+
+    State transitions are logged, and the state is published through `metrics` as
+    the gauge `breaker.<name>.state` (0 closed, 1 half-open, 2 open).
+
+    Args:
+        name: Name of the upstream, e.g. `stac` or `tiler`.
+        failure_threshold: Consecutive failures before opening.
+        reset_timeout: Seconds to stay open before allowing a trial call.
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half-open"
+    OPEN = "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._state = self.CLOSED
+        metrics.set_gauge(f"breaker.{self.name}.state", 0)
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _transition(self, state: str) -> None:
+        if state == self._state:
+            return
+        log = logger.warning if state == self.OPEN else logger.info
+        log(f"Circuit breaker '{self.name}': {self._state} -> {state}")
+        self._state = state
+        metrics.set_gauge(f"breaker.{self.name}.state", self._STATE_VALUES[state])
+        metrics.increment(f"breaker.{self.name}.{state}")
+
+    def _before_call(self) -> bool:
+        """
+        Let a call through or reject it.
+
+        Returns:
+            Whether the call is the half-open trial call.
+        """
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    metrics.increment(f"breaker.{self.name}.rejected")
+                    raise CircuitOpenError(f"Upstream '{self.name}' circuit is open")
+                self._transition(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    metrics.increment(f"breaker.{self.name}.rejected")
+                    raise CircuitOpenError(f"Upstream '{self.name}' circuit is half-open")
+                self._trial_in_flight = True
+                return True
+        return False
+
+    def _end_trial(self) -> None:
+        with self._lock:
+            self._trial_in_flight = False
+
+    def _on_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            self._transition(self.CLOSED)
+
+    def _on_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Call `fn(*args, **kwargs)` through the breaker.
+
+        Only errors for which `is_upstream_failure` holds count as failures. A trial
+        call ending any other way, even with a `BaseException` such as a
+        cancellation, lets the next call be the trial instead.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+        """
+        trial = self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_upstream_failure(e):
+                self._on_failure()
+            raise
+        else:
+            self._on_success()
+            return result
+        finally:
+            if trial:
+                self._end_trial()
+
+    async def acall(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Await `fn(*args, **kwargs)` through the breaker, like `call` for coroutines.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+        """
+        trial = self._before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            if is_upstream_failure(e):
+                self._on_failure()
+            raise
+        else:
+            self._on_success()
+            return result
+        finally:
+            if trial:
+                self._end_trial()
@@ -0,0 +1,131 @@
+"""
+Conditional revalidation of cached STAC listings.
+
+Listings are kept with the validators of the response they were parsed from:
+its `ETag` and `Last-Modified` headers, and a digest of the body for APIs that
+send neither. Fetching a listing again sends a conditional request, and an
+unchanged listing, whether answered `304 Not Modified` or with an identical
+body, is served from the cache without being parsed again.
+
+Listings are kept in the disk cache shared by the workers and background job
+processes of the host (`BACKGROUND_CACHE_DIR`), since catalog discovery runs in
+a new process per job and an in-process cache would be gone after every job.
+
+Item searches have no validators, so collection walks are revalidated with a
+fingerprint instead (see `collection_fingerprint`).
+"""
+import hashlib
+import logging
+from typing import Any, Callable
+
+import diskcache
+import metrics
+import requests
+from config import BACKGROUND_CACHE_DIR, ITEM_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class _Listing:
+    """
+    A parsed listing and the validators of the response it came from.
+    """
+
+    __slots__ = ("etag", "last_modified", "digest", "value")
+
+    def __init__(self, etag: str | None, last_modified: str | None, digest: str, value: Any) -> None:
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.value = value
+
+
+# Parsed listings by (URL, query parameters), shared by every process of the host
+listings = diskcache.Cache(BACKGROUND_CACHE_DIR)
+
+
+def get_revalidated(
+    session: requests.Session,
+    url: str,
+    parse: Callable[[dict], Any],
+    params: dict | None = None,
+    timeout: float | None = None,
+) -> Any:
+    """
+    GET a JSON listing, revalidating the cached copy instead of parsing it again.
+
+    Publishes `stac.listings.not_modified` (answered 304), `stac.listings.unchanged`
+    (same body) and `stac.listings.changed`.
+
+    Args:
+        session: Session to request with, e.g. the `StacApiIO` session.
+        url: URL of the listing.
+        parse: Turns the JSON body into the value to cache.
+        params: Query parameters.
+        timeout: Request timeout.
+
+    Returns:
+        `parse()` of the current listing.
+    """
+    key = ("stac-listing", url, tuple(sorted((params or {}).items())))
+    cached = listings.get(key)
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    response = session.get(url, params=params, headers=headers, timeout=timeout)
+    if response.status_code == 304 and cached is not None:
+        metrics.increment("stac.listings.not_modified")
+        listings.touch(key, expire=ITEM_CACHE_TTL)
+        return cached.value
+    response.raise_for_status()
+
+    digest = hashlib.sha256(response.content).hexdigest()
+    if cached is not None and cached.digest == digest:
+        metrics.increment("stac.listings.unchanged")
+        value = cached.value
+    else:
+        metrics.increment("stac.listings.changed")
+        value = parse(response.json())
+    listings.set(
+        key,
+        _Listing(response.headers.get("ETag"), response.headers.get("Last-Modified"), digest, value),
+        expire=ITEM_CACHE_TTL,
+    )
+    return value
+
+
+def collection_fingerprint(
+    session: requests.Session, search_url: str, collection_id: str, timeout: float | None = None
+) -> tuple | None:
+    """
+    Cheap fingerprint of a collection's items: their count and the latest item.
+
+    One search for a single item, sorted newest first. It changes whenever items
+    are added or removed, or the latest item is replaced.
+
+    Returns:
+        `(number matched, latest item id, its datetime, its updated time)`, or
+        `None` if the collection has no items.
+    """
+    response = session.post(
+        search_url,
+        json={
+            "collections": [collection_id],
+            "limit": 1,
+            "sortby": [{"field": "properties.datetime", "direction": "desc"}],
+        },
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    page = response.json()
+    features = page.get("features") or []
+    if not features:
+        return None
+    # `numberMatched` from STAC API 1.0, `context.matched` from the older context extension
+    matched = page.get("numberMatched", (page.get("context") or {}).get("matched"))
+    properties = features[0].get("properties", {})
+    return matched, features[0].get("id"), properties.get("datetime"), properties.get("updated")
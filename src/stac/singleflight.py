@@ -0,0 +1,89 @@
+import logging
+import threading
+from typing import Any, Callable, Hashable
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into a single in-flight call.
+
+    The first thread to call `do()` with a given key runs the function, any other
+    thread arriving with the same key while that call is running waits for it and
+    receives the same result (or exception). Nothing is cached once the call
+    returns, so the next call with the same key goes upstream again.
+
+    Counters are published through `metrics` as `<name>.executed` and
+    `<name>.coalesced`.
+
+    Example:
+        >>> flight = SingleFlight("tiler.statistics")
+        >>> flight.do(("cog", 1), fetch_statistics, "cog", 1)
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(
+        self,
+        key: Hashable,
+        fn: Callable[..., Any],
+        *args,
+        wait_timeout: float | None = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Run `fn(*args, **kwargs)`, or join an identical call already in flight.
+
+        Args:
+            key: Hashable identity of the call, e.g. the upstream URL and params.
+            fn: The function performing the upstream call.
+            wait_timeout: Longest time to wait when joining another caller's call.
+
+        Returns:
+            The return value of `fn`, shared between all coalesced callers.
+
+        Raises:
+            TimeoutError: If the joined call did not finish within `wait_timeout`.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            metrics.increment(f"{self.name}.coalesced")
+            logger.debug(f"{self.name}: joined in-flight call for {key}")
+            if not call.done.wait(wait_timeout):
+                raise TimeoutError(f"{self.name}: timed out waiting for in-flight call")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.increment(f"{self.name}.executed")
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -0,0 +1,283 @@
+"""
+Offline catalog snapshots.
+
+A snapshot is a single gzipped JSON file holding everything the dashboard reads
+from the STAC API (collections, item summaries) and, optionally, titiler band
+statistics. Setting `CATALOG_SNAPSHOT` makes the dashboard serve from the file
+instead of `STAC_FASTAPI_URL`, so workers boot with a warm index and do not need a
+live STAC API.
+
+Usage (from `src/`):
+    python -m stac.snapshot export --output ../catalog-snapshot.json.gz --statistics 2
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import threading
+from datetime import datetime as dt, timezone
+
+from config import CATALOG_SNAPSHOT
+from dateutil import parser
+
+from .spatial import BBox, bbox_intersects
+from .summary import ItemSummary
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def _iso(value: dt | None) -> str | None:
+    if value is None:
+        return None
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _encode_summary(summary: ItemSummary) -> list:
+    return [
+        summary.item_id,
+        _iso(summary.reference_time),
+        _iso(summary.end_time),
+        summary.leadtime,
+        list(summary.asset_hrefs),
+        summary.band_map,
+        list(summary.bbox) if summary.bbox else None,
+    ]
+
+
+def _decode_summary(collection_id: str, record: list) -> ItemSummary:
+    item_id, reference_time, end_time, leadtime, hrefs, band_map, bbox = record
+    return ItemSummary(
+        collection_id=collection_id,
+        item_id=item_id,
+        reference_time=parser.isoparse(reference_time) if reference_time else None,
+        end_time=parser.isoparse(end_time) if end_time else None,
+        leadtime=leadtime,
+        asset_hrefs=tuple(hrefs),
+        band_map=band_map,
+        bbox=tuple(bbox) if bbox else None,
+    )
+
+
+def _statistics_key(cog_url: str, band_index: int) -> str:
+    return f"{band_index}|{cog_url}"
+
+
+class Snapshot:
+    """
+    An offline catalog loaded into memory.
+
+    Attributes:
+        collection_bboxes: Mapping of collection id to its bbox.
+        summaries: Mapping of collection id to its item summaries, by reference time.
+        statistics: Mapping of `band|href` to titiler band statistics.
+    """
+
+    def __init__(self, data: dict) -> None:
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported catalog snapshot version: {data.get('version')}")
+        self.created = data.get("created")
+        self.stac_url = data.get("stac_url")
+        self.collection_bboxes: dict[str, list[float]] = {}
+        self.summaries: dict[str, list[ItemSummary]] = {}
+        self._by_reference_time: dict[tuple[str, dt], ItemSummary] = {}
+        for collection_id, collection in data["collections"].items():
+            self.collection_bboxes[collection_id] = collection["bbox"]
+            summaries = [_decode_summary(collection_id, record) for record in collection["items"]]
+            self.summaries[collection_id] = summaries
+            for summary in summaries:
+                self._by_reference_time[(collection_id, summary.reference_time)] = summary
+        self.statistics: dict[str, dict] = data.get("statistics", {})
+
+    def find(self, collection_id: str, forecast_reference_time: str) -> ItemSummary | None:
+        return self._by_reference_time.get((collection_id, parser.isoparse(forecast_reference_time)))
+
+    def get_statistics(self, cog_url: str, band_index: int) -> dict | None:
+        return self.statistics.get(_statistics_key(cog_url, band_index))
+
+
+def load_snapshot(path: str) -> Snapshot:
+    """
+    Read a snapshot file written by `export_snapshot`.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        snapshot = Snapshot(json.load(f))
+    logger.info(f"Loaded catalog snapshot {path} created {snapshot.created} from {snapshot.stac_url}")
+    return snapshot
+
+
+_snapshot: Snapshot | None = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> Snapshot | None:
+    """
+    The snapshot named by `CATALOG_SNAPSHOT`, loaded once per process.
+
+    Returns:
+        The snapshot, or `None` if the dashboard runs against the live STAC API.
+    """
+    global _snapshot
+    if not CATALOG_SNAPSHOT:
+        return None
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = load_snapshot(CATALOG_SNAPSHOT)
+    return _snapshot
+
+
+class SnapshotCatalog:
+    """
+    Read-only stand-in for `STAC` serving from a `Snapshot`.
+
+    Implements the `STAC` methods the callbacks use, with the same errors for
+    missing items. Nothing here makes a network request.
+
+    Args:
+        snapshot: The loaded snapshot.
+        bbox: Current map viewport, items outside it are treated as missing.
+    """
+
+    def __init__(self, snapshot: Snapshot, bbox: BBox | None = None) -> None:
+        self._snapshot = snapshot
+        self._viewport = bbox
+
+    def _visible(self, summary: ItemSummary) -> bool:
+        return self._viewport is None or summary.bbox is None or bbox_intersects(summary.bbox, self._viewport)
+
+    def get_collection_bboxes(self) -> dict[str, list[float]]:
+        return dict(self._snapshot.collection_bboxes)
+
+    def get_collection_extents(self, collection_id):
+        summaries = self._snapshot.summaries[collection_id]
+        temporal_extent = [summaries[0].reference_time, summaries[-1].reference_time] if summaries else [None, None]
+        return temporal_extent, self._snapshot.collection_bboxes[collection_id]
+
+    def get_collection_item_summaries(self, collection_id) -> list[ItemSummary]:
+        if collection_id not in self._snapshot.summaries:
+            raise ValueError(f"Collection {collection_id} is not in the catalog snapshot.")
+        return [s for s in self._snapshot.summaries[collection_id] if self._visible(s)]
+
+    def get_collection_forecast_init_dates(self, collection_id) -> list[dt]:
+        return [s.reference_time for s in self.get_collection_item_summaries(collection_id)]
+
+    def get_item_summary(self, collection_id: str, forecast_reference_time: str) -> ItemSummary:
+        summary = self._snapshot.find(collection_id, forecast_reference_time)
+        if summary is None or not self._visible(summary):
+            raise ValueError(f"No item found with forecast:reference_time = {forecast_reference_time} in collection {collection_id}.")
+        return summary
+
+    def get_item_summaries(
+        self, collection_ids: list[str], forecast_reference_time: str
+    ) -> dict[str, "ItemSummary | Exception"]:
+        results = {}
+        for collection_id in collection_ids:
+            try:
+                results[collection_id] = self.get_item_summary(collection_id, forecast_reference_time)
+            except ValueError as e:
+                results[collection_id] = e
+        return results
+
+    def get_item_leadtime(self, collection_id: str, forecast_reference_time: str):
+        return self.get_item_summary(collection_id, forecast_reference_time).leadtime
+
+    def get_item_extents(self, collection_id: str, forecast_reference_time: str):
+        summary = self.get_item_summary(collection_id, forecast_reference_time)
+        return [summary.reference_time, summary.end_time], list(summary.bbox) if summary.bbox else None
+
+    def get_item_bands(self, collection_id: str, forecast_reference_time: str) -> dict[str, int]:
+        return dict(self.get_item_summary(collection_id, forecast_reference_time).band_map)
+
+
+def export_snapshot(
+    stac,
+    path: str,
+    collection_ids: list[str] | None = None,
+    statistics_items: int = 0,
+    tiler_url: str | None = None,
+) -> dict:
+    """
+    Write the catalog view the dashboard needs to a snapshot file.
+
+    Args:
+        stac: A `STAC` instance for the live catalog.
+        path: Output file, written gzipped.
+        collection_ids: Collections to include, defaults to all.
+        statistics_items: For this many of the latest items per collection, also
+            store titiler statistics of every band of every COG asset.
+        tiler_url: titiler URL, required if `statistics_items` is set.
+
+    Returns:
+        Counts of collections, items and statistics written.
+    """
+    from callbacks.utils import get_cog_band_statistics
+
+    bboxes = stac.get_collection_bboxes()
+    collection_ids = collection_ids or list(bboxes)
+    collections = {}
+    statistics = {}
+    n_items = 0
+    for collection_id in collection_ids:
+        summaries = stac.get_collection_item_summaries(collection_id)
+        logger.info(f"{collection_id}: {len(summaries)} items")
+        collections[collection_id] = {
+            "bbox": bboxes[collection_id],
+            "items": [_encode_summary(summary) for summary in summaries],
+        }
+        n_items += len(summaries)
+        for summary in summaries[-statistics_items:] if statistics_items else []:
+            for href in summary.asset_hrefs:
+                for band_index in summary.band_map.values():
+                    try:
+                        statistics[_statistics_key(href, band_index)] = get_cog_band_statistics(
+                            tiler_url, cog_url=href, band_index=band_index
+                        )
+                    except Exception as e:
+                        logger.warning(f"Statistics failed for {href} band {band_index}: {e}")
+
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "created": _iso(dt.now(timezone.utc)),
+        "stac_url": getattr(stac, "_url", None),
+        "collections": collections,
+        "statistics": statistics,
+    }
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return {"collections": len(collections), "items": n_items, "statistics": len(statistics)}
+
+
+def main() -> None:
+    from config import STAC_FASTAPI_URL, TILER_URL
+
+    from .process import STAC
+
+    argparser = argparse.ArgumentParser(description="Export an offline catalog snapshot for the dashboard.")
+    subparsers = argparser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="Export the live catalog to a snapshot file")
+    export.add_argument("-o", "--output", required=True, help="Snapshot file to write (gzipped JSON)")
+    export.add_argument("-c", "--collections", nargs="*", help="Collections to include (default: all)")
+    export.add_argument(
+        "-s", "--statistics", type=int, default=0,
+        help="Store band statistics for this many of the latest items per collection",
+    )
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    counts = export_snapshot(
+        STAC(STAC_FASTAPI_URL),
+        args.output,
+        collection_ids=args.collections,
+        statistics_items=args.statistics,
+        tiler_url=TILER_URL,
+    )
+    logger.info(f"Wrote {args.output}: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import math
+import threading
+from typing import Hashable, Iterable
+
+# A bounding box in STAC order: (west, south, east, north), in degrees.
+# `west > east` means the box crosses the antimeridian.
+BBox = tuple[float, float, float, float]
+
+WORLD: BBox = (-180.0, -90.0, 180.0, 90.0)
+
+
+def _wrap_lon(lon: float) -> float:
+    return ((lon + 180.0) % 360.0) - 180.0
+
+
+def leaflet_bounds_to_bbox(bounds: list | None) -> BBox | None:
+    """
+    Convert dash-leaflet `Map.bounds` to a STAC bbox.
+
+    Leaflet reports `[[south, west], [north, east]]`, with longitudes outside
+    [-180, 180] once the map has been panned across the antimeridian or zoomed
+    out past one world width.
+
+    Args:
+        bounds: The `bounds` property of a `dl.Map`.
+
+    Returns:
+        A normalised `(west, south, east, north)` bbox, or `None` if no bounds.
+    """
+    if not bounds:
+        return None
+    (south, west), (north, east) = bounds
+    south, north = max(-90.0, south), min(90.0, north)
+    if east - west >= 360.0:
+        return (-180.0, south, 180.0, north)
+    return (_wrap_lon(west), south, _wrap_lon(east), north)
+
+
+def _split(bbox: BBox) -> list[BBox]:
+    """Split a bbox crossing the antimeridian into two that do not."""
+    west, south, east, north = bbox
+    if west <= east:
+        return [bbox]
+    return [(west, south, 180.0, north), (-180.0, south, east, north)]
+
+
+def bbox_intersects(a: BBox, b: BBox) -> bool:
+    """
+    Whether two bboxes overlap, allowing for either crossing the antimeridian.
+    """
+    return any(
+        aw <= be and bw <= ae and a_s <= bn and b_s <= an
+        for aw, a_s, ae, an in _split(a)
+        for bw, b_s, be, bn in _split(b)
+    )
+
+
+def search_bbox(bbox: BBox | None, step: float = 1.0) -> list[float] | None:
+    """
+    Bbox to send upstream with a STAC search.
+
+    The viewport is snapped outwards to `step` degrees so that nearby viewports
+    share the same search (and so coalesce and cache together). Viewports crossing
+    the antimeridian are widened to all longitudes, since not every STAC backend
+    accepts `west > east`.
+
+    Args:
+        bbox: The viewport bbox, or `None` for no spatial filter.
+        step: Grid size in degrees to snap to.
+
+    Returns:
+        `[west, south, east, north]`, or `None`.
+    """
+    if bbox is None:
+        return None
+    west, south, east, north = bbox
+    if west > east:
+        west, east = -180.0, 180.0
+    return [
+        max(-180.0, math.floor(west / step) * step),
+        max(-90.0, math.floor(south / step) * step),
+        min(180.0, math.ceil(east / step) * step),
+        min(90.0, math.ceil(north / step) * step),
+    ]
+
+
+class SpatialIndex:
+    """
+    Small in-memory grid index of bboxes keyed by id (e.g. collection or item ids).
+
+    Each entry is registered in every `cell_size` degree cell its bbox touches, so
+    a viewport query only tests the entries sharing a cell with it.
+
+    Args:
+        cell_size: Grid cell size in degrees.
+
+    Example:
+        >>> index = SpatialIndex()
+        >>> index.insert("arctic", (-180, 60, 180, 90))
+        >>> index.query((0, 70, 10, 80))
+        {'arctic'}
+    """
+
+    def __init__(self, cell_size: float = 10.0) -> None:
+        self._cell_size = cell_size
+        self._lock = threading.Lock()
+        self._bboxes: dict[Hashable, BBox] = {}
+        self._cells: dict[tuple[int, int], set[Hashable]] = {}
+
+    def __len__(self) -> int:
+        return len(self._bboxes)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._bboxes
+
+    def _cells_for(self, bbox: BBox) -> Iterable[tuple[int, int]]:
+        size = self._cell_size
+        max_x, max_y = int(360 // size) - 1, int(180 // size) - 1
+        for west, south, east, north in _split(bbox):
+            x0 = min(max_x, int((west + 180) // size))
+            x1 = min(max_x, int((east + 180) // size))
+            y0 = min(max_y, int((south + 90) // size))
+            y1 = min(max_y, int((north + 90) // size))
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    yield (x, y)
+
+    def insert(self, key: Hashable, bbox: Iterable[float]) -> None:
+        """
+        Add or replace the bbox of `key`.
+        """
+        bbox = tuple(float(v) for v in bbox)[:4]
+        with self._lock:
+            self._remove(key)
+            self._bboxes[key] = bbox
+            for cell in self._cells_for(bbox):
+                self._cells.setdefault(cell, set()).add(key)
+
+    def _remove(self, key: Hashable) -> None:
+        bbox = self._bboxes.pop(key, None)
+        if bbox is None:
+            return
+        for cell in self._cells_for(bbox):
+            self._cells.get(cell, set()).discard(key)
+
+    def remove(self, key: Hashable) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def get(self, key: Hashable) -> BBox | None:
+        return self._bboxes.get(key)
+
+    def query(self, bbox: BBox | None) -> set[Hashable]:
+        """
+        Ids whose bbox intersects `bbox` (all ids if `bbox` is `None`).
+        """
+        with self._lock:
+            if bbox is None:
+                return set(self._bboxes)
+            candidates = set()
+            for cell in self._cells_for(bbox):
+                candidates |= self._cells.get(cell, set())
+            return {key for key in candidates if bbox_intersects(self._bboxes[key], bbox)}
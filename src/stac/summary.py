@@ -0,0 +1,101 @@
+from datetime import datetime as dt
+
+from dateutil import parser
+from pystac import MediaType
+
+
+def _parse_datetime(value: str | None) -> dt | None:
+    return parser.isoparse(value) if value else None
+
+
+class ItemSummary:
+    """
+    Compact record of the parts of a forecast STAC Item the dashboard uses.
+
+    Built straight from the raw item JSON returned by a search, so none of the
+    asset, link and property objects of a `pystac.Item` are created or kept.
+
+    Attributes:
+        collection_id: Collection the item belongs to.
+        item_id: STAC id of the item.
+        reference_time: The item's `forecast:reference_time` (or `datetime`).
+        end_time: The item's `forecast:end_time`, if set.
+        leadtime: The item's `forecast:leadtime_length`, if set.
+        asset_hrefs: Hrefs of the COG data assets, in leadtime order.
+        band_map: Mapping of band name to band index, from `forecast:bands`.
+        bbox: The item's `(west, south, east, north)` bbox, if set.
+    """
+
+    __slots__ = (
+        "collection_id",
+        "item_id",
+        "reference_time",
+        "end_time",
+        "leadtime",
+        "asset_hrefs",
+        "band_map",
+        "bbox",
+    )
+
+    def __init__(
+        self,
+        collection_id: str,
+        item_id: str,
+        reference_time: dt | None,
+        end_time: dt | None,
+        leadtime: int | None,
+        asset_hrefs: tuple[str, ...],
+        band_map: dict[str, int],
+        bbox: tuple[float, ...] | None,
+    ) -> None:
+        self.collection_id = collection_id
+        self.item_id = item_id
+        self.reference_time = reference_time
+        self.end_time = end_time
+        self.leadtime = leadtime
+        self.asset_hrefs = asset_hrefs
+        self.band_map = band_map
+        self.bbox = bbox
+
+    def __repr__(self) -> str:
+        return (
+            f"ItemSummary({self.collection_id!r}, {self.item_id!r}, "
+            f"reference_time={self.reference_time!r}, leadtimes={len(self.asset_hrefs)})"
+        )
+
+    @classmethod
+    def from_dict(cls, collection_id: str, item: dict) -> "ItemSummary":
+        """
+        Build a summary from the raw JSON of a STAC Item.
+
+        Args:
+            collection_id: Collection the item was searched for in.
+            item: A STAC Item as a dict, e.g. from `ItemSearch.items_as_dicts()`.
+
+        Returns:
+            The item summary.
+        """
+        properties = item.get("properties", {})
+        reference_time_str = properties.get("forecast:reference_time") or properties.get("datetime")
+
+        asset_hrefs = []
+        band_props = None
+        for key, asset in item.get("assets", {}).items():
+            if asset.get("type") != MediaType.COG or "data" not in asset.get("roles", []):
+                continue
+            asset_hrefs.append(asset["href"])
+            # Prefer the bands of the asset keyed by the reference time, as before.
+            if "forecast:bands" in asset and (band_props is None or key == reference_time_str):
+                band_props = asset["forecast:bands"]
+
+        bbox = item.get("bbox")
+        return cls(
+            collection_id=collection_id,
+            item_id=item.get("id"),
+            reference_time=_parse_datetime(reference_time_str),
+            end_time=_parse_datetime(properties.get("forecast:end_time")),
+            leadtime=properties.get("forecast:leadtime_length"),
+            asset_hrefs=tuple(asset_hrefs),
+            band_map={band["name"]: band["index"] for band in band_props or []},
+            bbox=tuple(bbox) if bbox else None,
+        )
@@ -0,0 +1,95 @@
+"""
+Preload-safe startup for gunicorn.
+
+With `preload_app` (see `gunicorn.conf.py`) the app is imported once in the
+gunicorn master. `warm_start()` then fills the process-level caches there (the
+collection index, item summaries from the date index, the colorscale table) and
+freezes them out of the garbage collector, so forked workers share those pages
+copy-on-write and start warm. Workers are only forked once `warm_start()`
+returns, so it is bounded by `WARM_START_TIMEOUT`. `after_fork()` drops the
+connections and file handles a worker must not share with the master.
+"""
+import gc
+import logging
+import time
+
+from config import STAC_FASTAPI_URL, WARM_START_TIMEOUT
+from rio_tiler.colormap import ColorMaps
+from stac import aio, datacube, revalidate
+from stac.process import STAC, item_cache, item_index, open_catalog
+from stac.resilience import Deadline
+
+from callbacks import background
+from callbacks.catalog_cache import collection_item_summaries
+from callbacks.map_callbacks import collection_index
+from callbacks.utils import convert_colormap_to_colorscale
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_colorscales() -> None:
+    for name in ColorMaps().list():
+        convert_colormap_to_colorscale(name)
+
+
+def _warm_catalog(deadline: Deadline) -> int:
+    """
+    Load the collection list and every collection's item summaries.
+
+    Returns:
+        Number of item summaries loaded.
+    """
+    stac = open_catalog(STAC_FASTAPI_URL, deadline=deadline)
+    collection_bboxes = stac.get_collection_bboxes()
+    for collection_id, bbox in collection_bboxes.items():
+        collection_index.insert(collection_id, bbox)
+    if not isinstance(stac, STAC):
+        # Offline snapshots are already loaded in full
+        return 0
+
+    n_items = 0
+    for collection_id in collection_bboxes:
+        if deadline.expired:
+            logger.warning(f"Warm start time budget exhausted before {collection_id}")
+            break
+        # Also builds the shared date index if no worker has yet
+        for summary in collection_item_summaries(stac, collection_id):
+            item_cache.set((STAC_FASTAPI_URL, collection_id, summary.reference_time), summary)
+            if summary.bbox:
+                item_index.insert((collection_id, summary.reference_time), summary.bbox)
+            n_items += 1
+    return n_items
+
+
+def warm_start() -> None:
+    """
+    Fill the process-level caches before workers are forked.
+
+    Failures are logged rather than raised, workers then start cold.
+    """
+    start = time.perf_counter()
+    _warm_colorscales()
+    n_items = 0
+    try:
+        n_items = _warm_catalog(Deadline(WARM_START_TIMEOUT))
+    except Exception as e:
+        logger.warning(f"Warm start could not load the catalog: {e}")
+    # Keep the collector from touching (and so copying) the shared objects
+    gc.collect()
+    gc.freeze()
+    logger.info(
+        f"Warm start: {len(collection_index)} collections, {n_items} items "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+
+def after_fork() -> None:
+    """
+    Drop connections and file handles inherited from the master, they are
+    reopened on first use: the shared disk caches, the async upstream loop and
+    client, and the datacube's open COGs.
+    """
+    background.cache.close()
+    revalidate.listings.close()
+    aio.reset()
+    datacube.close_all()